@@ -1,5 +1,6 @@
 'use client';
 import { useState, useEffect, useRef, useCallback } from 'react';
+import { inflate } from 'pako';
 import type { TrafficEntry, DashboardStats } from '@/types';
 
 interface WSMessage {
@@ -36,6 +37,10 @@ export function useWebSocket() {
     const connect = useCallback(() => {
         try {
             const ws = new WebSocket('ws://localhost:8765');
+            // Large frames arrive as zlib-compressed binary (the server
+            // compresses once for all clients instead of per-connection
+            // permessage-deflate); small frames stay plain text
+            ws.binaryType = 'arraybuffer';
             wsRef.current = ws;
 
             ws.onopen = () => {
@@ -46,7 +51,10 @@ export function useWebSocket() {
 
             ws.onmessage = (event) => {
                 try {
-                    const data: WSMessage = JSON.parse(event.data);
+                    const text = typeof event.data === 'string'
+                        ? event.data
+                        : inflate(new Uint8Array(event.data), { to: 'string' });
+                    const data: WSMessage = JSON.parse(text);
 
                     if (data.type === 'init') {
                         if (data.traffic) setTraffic(data.traffic);
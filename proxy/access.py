@@ -8,11 +8,13 @@ Provides endpoint-level and keyword-level filtering:
 Rules are persisted to data/access_rules.json.
 """
 from __future__ import annotations
-import json
 import os
 import threading
 from dataclasses import dataclass, field
 
+import ahocorasick
+import orjson
+
 RULES_PATH = os.path.join(os.path.dirname(__file__), "data", "access_rules.json")
 
 
@@ -30,20 +32,92 @@ class AccessRules:
     blocked_models: list[str] = field(default_factory=list)
 
 
+@dataclass(frozen=True)
+class _RuleSnapshot:
+    """Immutable, precomputed view of AccessRules for lock-free reads.
+
+    Writers build a fresh snapshot and swap it in with a single attribute
+    assignment (atomic in CPython); readers load it once and work on
+    locals, so the request path never takes the lock.
+    """
+    allowed_endpoints: tuple[str, ...]
+    blocked_endpoints: tuple[str, ...]
+    # Substring automatons over the endpoint patterns — one pass over
+    # the URL regardless of list size. None when the list is empty.
+    # (Patterns match anywhere in the URL, so a prefix trie would
+    # change semantics; Aho-Corasick keeps them.)
+    allow_automaton: ahocorasick.Automaton | None
+    block_automaton: ahocorasick.Automaton | None
+    allowed_models_lower: tuple[str, ...]
+    blocked_models_lower: tuple[str, ...]
+    # Exact-match sets: model names are usually whole tokens, so an O(1)
+    # membership test short-circuits the substring loops
+    allowed_models_set: frozenset[str]
+    blocked_models_set: frozenset[str]
+    keyword_automaton: ahocorasick.Automaton | None
+
+
+def _substring_automaton(patterns: list[str]) -> ahocorasick.Automaton | None:
+    """Automaton matching any of `patterns` as substrings, or None."""
+    if not patterns:
+        return None
+    automaton = ahocorasick.Automaton()
+    for pattern in patterns:
+        automaton.add_word(pattern, pattern)
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_snapshot(rules: AccessRules) -> _RuleSnapshot:
+    """Compile an AccessRules into an immutable read-optimized snapshot."""
+    automaton = None
+    if rules.blocked_keywords:
+        automaton = ahocorasick.Automaton()
+        for keyword in rules.blocked_keywords:
+            # All keywords are matched in a single O(len(text)) pass;
+            # store the original casing for the block message.
+            automaton.add_word(keyword.lower(), keyword)
+        automaton.make_automaton()
+
+    allowed_models_lower = tuple(m.lower() for m in rules.allowed_models)
+    blocked_models_lower = tuple(m.lower() for m in rules.blocked_models)
+    return _RuleSnapshot(
+        allowed_endpoints=tuple(rules.allowed_endpoints),
+        blocked_endpoints=tuple(rules.blocked_endpoints),
+        allow_automaton=_substring_automaton(rules.allowed_endpoints),
+        block_automaton=_substring_automaton(rules.blocked_endpoints),
+        allowed_models_lower=allowed_models_lower,
+        blocked_models_lower=blocked_models_lower,
+        allowed_models_set=frozenset(allowed_models_lower),
+        blocked_models_set=frozenset(blocked_models_lower),
+        keyword_automaton=automaton,
+    )
+
+
 class AccessManager:
-    """Manages allowlist/blocklist rules with file persistence."""
+    """Manages allowlist/blocklist rules with file persistence.
+
+    Reads go through a copy-on-write snapshot and are lock-free; only
+    rule updates take the lock. Replace ``self.rules`` (or call
+    ``update_rules``) rather than mutating its lists in place.
+    """
+
+    # Class-level defaults so a manager always has them before first build
+    _snap: _RuleSnapshot | None = None
+    _snap_rules_ref: AccessRules | None = None
 
     def __init__(self):
         self._lock = threading.Lock()
         self.rules = self._load()
+        self._refresh_snapshot()
 
     def _load(self) -> AccessRules:
         """Load rules from disk."""
         if not os.path.exists(RULES_PATH):
             return AccessRules()
         try:
-            with open(RULES_PATH, "r") as f:
-                data = json.load(f)
+            with open(RULES_PATH, "rb") as f:
+                data = orjson.loads(f.read())
             return AccessRules(**data)
         except Exception:
             return AccessRules()
@@ -51,14 +125,28 @@ class AccessManager:
     def _save(self):
         """Persist rules to disk."""
         os.makedirs(os.path.dirname(RULES_PATH), exist_ok=True)
-        with open(RULES_PATH, "w") as f:
-            json.dump({
+        with open(RULES_PATH, "wb") as f:
+            f.write(orjson.dumps({
                 "allowed_endpoints": self.rules.allowed_endpoints,
                 "blocked_endpoints": self.rules.blocked_endpoints,
                 "blocked_keywords": self.rules.blocked_keywords,
                 "allowed_models": self.rules.allowed_models,
                 "blocked_models": self.rules.blocked_models,
-            }, f, indent=2)
+            }, option=orjson.OPT_INDENT_2))
+
+    def _refresh_snapshot(self):
+        """Rebuild the read snapshot from self.rules (writer path)."""
+        snap = _build_snapshot(self.rules)
+        self._snap = snap
+        self._snap_rules_ref = self.rules
+
+    def _snapshot(self) -> _RuleSnapshot:
+        """Get the current snapshot, rebuilding if rules were swapped."""
+        if self._snap is None or self._snap_rules_ref is not self.rules:
+            with self._lock:
+                if self._snap is None or self._snap_rules_ref is not self.rules:
+                    self._refresh_snapshot()
+        return self._snap
 
     def check_endpoint(self, endpoint: str) -> tuple[str, str | None]:
         """Check if an endpoint is allowed, blocked, or needs inspection.
@@ -68,57 +156,60 @@ class AccessManager:
             ("block", reason) — reject immediately
             ("inspect", None) — proceed with normal pipeline
         """
-        with self._lock:
-            # Check allowlist first
-            for pattern in self.rules.allowed_endpoints:
-                if pattern in endpoint:
-                    return "allow", None
+        snap = self._snapshot()
+
+        # Check allowlist first — single automaton pass over the URL
+        if snap.allow_automaton is not None:
+            if next(snap.allow_automaton.iter(endpoint), None) is not None:
+                return "allow", None
 
-            # Check blocklist
-            for pattern in self.rules.blocked_endpoints:
-                if pattern in endpoint:
-                    return "block", f"Endpoint matches blocklist pattern: {pattern}"
+        # Check blocklist
+        if snap.block_automaton is not None:
+            hit = next(snap.block_automaton.iter(endpoint), None)
+            if hit is not None:
+                return "block", f"Endpoint matches blocklist pattern: {hit[1]}"
 
         return "inspect", None
 
     def check_model(self, model: str) -> tuple[str, str | None]:
         """Check if a model is allowed or blocked."""
-        with self._lock:
-            if self.rules.blocked_models:
-                for blocked in self.rules.blocked_models:
-                    if blocked.lower() in model.lower():
-                        return "block", f"Model '{model}' is blocklisted"
-
-            if self.rules.allowed_models:
-                for allowed in self.rules.allowed_models:
-                    if allowed.lower() in model.lower():
-                        return "allow", None
-                return "block", f"Model '{model}' is not in the allowlist"
+        snap = self._snapshot()
+        model_lower = model.lower()
+
+        if snap.blocked_models_lower:
+            if model_lower in snap.blocked_models_set:
+                return "block", f"Model '{model}' is blocklisted"
+            for blocked in snap.blocked_models_lower:
+                if blocked in model_lower:
+                    return "block", f"Model '{model}' is blocklisted"
+
+        if snap.allowed_models_lower:
+            if model_lower in snap.allowed_models_set:
+                return "allow", None
+            for allowed in snap.allowed_models_lower:
+                if allowed in model_lower:
+                    return "allow", None
+            return "block", f"Model '{model}' is not in the allowlist"
 
         return "allow", None
 
     def check_keywords(self, text: str) -> tuple[bool, str | None]:
         """Check if text contains any blocked keywords."""
-        lower_text = text.lower()
-        with self._lock:
-            for keyword in self.rules.blocked_keywords:
-                if keyword.lower() in lower_text:
-                    return True, f"Blocked keyword detected: '{keyword}'"
+        automaton = self._snapshot().keyword_automaton
+        if automaton is None:
+            return False, None
+        hit = next(automaton.iter(text.lower()), None)
+        if hit is not None:
+            return True, f"Blocked keyword detected: '{hit[1]}'"
         return False, None
 
     def update_rules(self, data: dict) -> dict:
-        """Update access rules."""
+        """Update access rules (copy-on-write: builds fresh rules + snapshot)."""
         with self._lock:
-            if "allowed_endpoints" in data:
-                self.rules.allowed_endpoints = data["allowed_endpoints"]
-            if "blocked_endpoints" in data:
-                self.rules.blocked_endpoints = data["blocked_endpoints"]
-            if "blocked_keywords" in data:
-                self.rules.blocked_keywords = data["blocked_keywords"]
-            if "allowed_models" in data:
-                self.rules.allowed_models = data["allowed_models"]
-            if "blocked_models" in data:
-                self.rules.blocked_models = data["blocked_models"]
+            current = self.to_dict()
+            current.update({k: v for k, v in data.items() if k in current})
+            self.rules = AccessRules(**current)
+            self._refresh_snapshot()
             self._save()
         return self.to_dict()
 
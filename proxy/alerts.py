@@ -10,17 +10,31 @@ Supports multiple webhook URLs with configurable event filters.
 """
 from __future__ import annotations
 import asyncio
-import json
+import hashlib
+import hmac
 import logging
+import time
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
 from typing import Optional
 
 import aiohttp
+import orjson
 
 logger = logging.getLogger("pf.alerts")
 
+# How long a serialized alert body may be reused for identical alerts.
+# Bursts of the same event (e.g. repeated blocked requests) then cost
+# one json.dumps instead of one per fire.
+_BODY_CACHE_TTL = 1.0
+
+# Batching webhooks: buffer up to _BATCH_MAX payloads or _BATCH_WINDOW
+# seconds, whichever comes first, then POST one JSON array. Trades a
+# little latency for far fewer POSTs during alert storms.
+_BATCH_WINDOW = 0.2
+_BATCH_MAX = 50
+
 
 class AlertEvent(str, Enum):
     THREAT_HIGH = "threat_high"
@@ -37,6 +51,23 @@ class WebhookConfig:
     enabled: bool = True
     name: str = "default"
     secret: Optional[str] = None  # Optional HMAC signing key
+    batch: bool = False  # Opt in to debounced batch delivery
+
+
+def _sign_for(webhooks: list[WebhookConfig], body: bytes) -> dict[str, str]:
+    """Compute one HMAC-SHA256 signature per unique webhook secret.
+
+    Webhooks sharing a secret (common for multi-env setups) then share
+    one digest instead of recomputing it per endpoint. hmac.digest is
+    the single-shot C path.
+    """
+    sigs: dict[str, str] = {}
+    for webhook in webhooks:
+        if webhook.secret and webhook.secret not in sigs:
+            sigs[webhook.secret] = hmac.digest(
+                webhook.secret.encode(), body, hashlib.sha256
+            ).hex()
+    return sigs
 
 
 @dataclass
@@ -55,20 +86,40 @@ class AlertManager:
         self._webhooks: list[WebhookConfig] = []
         self._history: list[dict] = []  # Last 100 alerts
         self._session: aiohttp.ClientSession | None = None
+        # (expiry, (event, summary, severity), details, serialized body)
+        self._body_cache: tuple[float, tuple, dict, bytes] | None = None
+        # Pending payload dicts per batching webhook, keyed by webhook
+        # identity (names are not unique — add_webhook defaults to
+        # "default"), and the debounce task
+        self._pending: dict[int, tuple[WebhookConfig, list[dict]]] = {}
+        self._drain_task: asyncio.Task | None = None
 
     async def _get_session(self) -> aiohttp.ClientSession:
         if self._session is None or self._session.closed:
+            # Pooled keep-alive connections + DNS cache so bursts of
+            # alerts to the same webhook host reuse sockets instead of
+            # paying a TCP/TLS handshake per POST.
             self._session = aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=10)
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=10,
+                    keepalive_timeout=75,
+                    enable_cleanup_closed=True,
+                    ttl_dns_cache=300,
+                ),
+                timeout=aiohttp.ClientTimeout(total=10),
+                headers={"Connection": "keep-alive"},
             )
         return self._session
 
     def add_webhook(self, url: str, name: str = "default",
                     events: list[str] | None = None,
-                    secret: str | None = None) -> WebhookConfig:
+                    secret: str | None = None,
+                    batch: bool = False) -> WebhookConfig:
         """Register a new webhook endpoint."""
         event_list = [AlertEvent(e) for e in events] if events else list(AlertEvent)
-        wh = WebhookConfig(url=url, name=name, events=event_list, secret=secret)
+        wh = WebhookConfig(url=url, name=name, events=event_list, secret=secret,
+                           batch=batch)
         self._webhooks.append(wh)
         logger.info(f"[Alerts] Webhook registered: {name} → {url}")
         return wh
@@ -87,6 +138,7 @@ class AlertManager:
                 "url": w.url,
                 "events": [e.value for e in w.events],
                 "enabled": w.enabled,
+                "batch": w.batch,
             }
             for w in self._webhooks
         ]
@@ -126,30 +178,90 @@ class AlertManager:
         if not matching:
             return
 
-        body = json.dumps({
-            "event": payload.event.value,
-            "timestamp": payload.timestamp,
-            "summary": payload.summary,
-            "details": payload.details,
-            "severity": payload.severity,
-            "source": "prompt-firewall",
-        })
+        immediate = [w for w in matching if not w.batch]
+        batching = [w for w in matching if w.batch]
+
+        if batching:
+            event_dict = {
+                "event": payload.event.value,
+                "timestamp": payload.timestamp,
+                "summary": payload.summary,
+                "details": payload.details,
+                "severity": payload.severity,
+            }
+            drain_now = False
+            for w in batching:
+                queue = self._pending.setdefault(id(w), (w, []))[1]
+                queue.append(event_dict)
+                if len(queue) >= _BATCH_MAX:
+                    drain_now = True
+            if drain_now:
+                if self._drain_task is not None:
+                    self._drain_task.cancel()
+                    self._drain_task = None
+                await self._drain()
+            elif self._drain_task is None or self._drain_task.done():
+                self._drain_task = asyncio.create_task(self._drain_later())
+
+        if not immediate:
+            return
+
+        # Reuse the serialized body for identical alerts fired within the
+        # cache window (the cached timestamp is at most _BODY_CACHE_TTL old).
+        key = (payload.event.value, payload.summary, payload.severity)
+        cached = self._body_cache
+        if cached and time.monotonic() < cached[0] and cached[1] == key and cached[2] == details:
+            body = cached[3]
+        else:
+            body = orjson.dumps({
+                "event": payload.event.value,
+                "timestamp": payload.timestamp,
+                "summary": payload.summary,
+                "details": payload.details,
+                "severity": payload.severity,
+                "source": "prompt-firewall",
+            })
+            self._body_cache = (time.monotonic() + _BODY_CACHE_TTL, key, details, body)
 
         session = await self._get_session()
-        tasks = [self._send(session, w, body) for w in matching]
+        sigs = _sign_for(immediate, body)
+        tasks = [self._send(session, w, body, sigs.get(w.secret)) for w in immediate]
         await asyncio.gather(*tasks, return_exceptions=True)
 
+    async def _drain_later(self):
+        """Debounce: flush batched alerts after the batch window."""
+        await asyncio.sleep(_BATCH_WINDOW)
+        await self._drain()
+
+    async def _drain(self):
+        """POST pending batched alerts, one JSON array per webhook."""
+        self._drain_task = None
+        pending, self._pending = self._pending, {}
+        if not pending:
+            return
+
+        session = await self._get_session()
+        tasks = []
+        for webhook, events in pending.values():
+            if not events or not webhook.enabled:
+                continue
+            body = orjson.dumps({"events": events, "source": "prompt-firewall"})
+            signature = _sign_for([webhook], body).get(webhook.secret)
+            tasks.append(self._send(session, webhook, body, signature))
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
     async def _send(self, session: aiohttp.ClientSession,
-                    webhook: WebhookConfig, body: str):
+                    webhook: WebhookConfig, body: bytes,
+                    signature: str | None = None):
         """Send payload to a single webhook."""
         headers = {"Content-Type": "application/json"}
-        if webhook.secret:
-            import hashlib
-            import hmac
-            sig = hmac.new(
-                webhook.secret.encode(), body.encode(), hashlib.sha256
-            ).hexdigest()
-            headers["X-PF-Signature"] = sig
+        if signature is None and webhook.secret:
+            signature = hmac.digest(
+                webhook.secret.encode(), body, hashlib.sha256
+            ).hex()
+        if signature is not None:
+            headers["X-PF-Signature"] = signature
 
         try:
             async with session.post(webhook.url, data=body, headers=headers) as resp:
@@ -161,5 +273,9 @@ class AlertManager:
             logger.warning(f"[Alerts] Webhook {webhook.name} failed: {e}")
 
     async def close(self):
+        if self._drain_task is not None:
+            self._drain_task.cancel()
+            self._drain_task = None
+        await self._drain()
         if self._session and not self._session.closed:
             await self._session.close()
@@ -4,13 +4,35 @@ Uses SQLite for persistent, indexed storage.
 Supports daily/weekly/monthly spend queries with efficient indexed lookups.
 """
 from __future__ import annotations
-import json
+import atexit
 import os
 import sqlite3
 import threading
+import time
 from datetime import datetime, timedelta
+
+import orjson
+
 from models import BudgetRule, RuleAction
 
+# How long cached spend/token sums stay valid. Dashboard polling can hit
+# these several times a second; 1s staleness is fine for budget display.
+_CACHE_TTL = 1.0
+
+# How long buffered usage rows may sit before a background flush commits
+# them. One fsync per batch instead of one per request.
+_FLUSH_INTERVAL = 0.5
+
+# Buffered rows past this count flush immediately, capping how much a
+# burst can queue (and lose on a crash) between timer fires
+_FLUSH_THRESHOLD = 64
+
+# Costs are stored as integer micro-dollars (dollars × 1e6): SUM and
+# comparisons run on SQLite's integer fast path, rows encode smaller
+# than REALs, and accumulated spend is exact instead of drifting with
+# float rounding. Floats only appear at the API boundary.
+_COST_SCALE = 1_000_000
+
 # Approximate pricing per 1K tokens (input/output averaged)
 MODEL_PRICING: dict[str, float] = {
     "gpt-4o": 0.005,
@@ -36,40 +58,135 @@ MODEL_PRICING: dict[str, float] = {
 DB_PATH = os.path.join(os.path.dirname(__file__), "data", "budget.db")
 LEGACY_JSON = os.path.join(os.path.dirname(__file__), "data", "budget.json")
 
+# Hot-path SQL as module constants: the same string objects are passed
+# to execute() every call, so sqlite3's statement cache hits by identity
+_SQL_INSERT = "INSERT INTO usage (timestamp, model, tokens, cost) VALUES (?, ?, ?, ?)"
+_SQL_SUM_COST = "SELECT COALESCE(SUM(cost), 0) FROM usage WHERE timestamp >= ?"
+_SQL_SUM_TOKENS = "SELECT COALESCE(SUM(tokens), 0) FROM usage WHERE timestamp >= ?"
+_SQL_STATS = """
+    SELECT COALESCE(SUM(CASE WHEN timestamp >= ? THEN cost END), 0),
+           COALESCE(SUM(CASE WHEN timestamp >= ? THEN cost END), 0),
+           COALESCE(SUM(cost), 0),
+           COALESCE(SUM(CASE WHEN timestamp >= ? THEN tokens END), 0),
+           COALESCE(SUM(CASE WHEN timestamp >= ? THEN tokens END), 0)
+    FROM usage WHERE timestamp >= ?
+"""
+
 
 class BudgetTracker:
+    # Lazily created query cache: key → (expiry, value). Class-level None
+    # so instances built without __init__ (tests) still work.
+    _cache: dict | None = None
+    # Pending usage rows awaiting a batched INSERT, and the timer that
+    # will flush them. Same lazy-default treatment as _cache.
+    _buf: list[tuple] | None = None
+    _flush_timer: threading.Timer | None = None
+
     def __init__(self):
         self._lock = threading.Lock()
         os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-        self._conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        self._conn = sqlite3.connect(DB_PATH, check_same_thread=False,
+                                     cached_statements=256)
         self._create_tables()
         self._migrate_from_json()
+        atexit.register(self.flush)
 
     def _create_tables(self):
-        """Create the usage table with indexed timestamp."""
+        """Create the usage table with indexed integer timestamp.
+
+        Timestamps are unix-epoch seconds and costs micro-dollars (both
+        INTEGER), so range queries and SUMs run on integer fast paths,
+        and the covering index on (timestamp, cost, tokens) makes the
+        budget SUM queries index-only scans. WAL + synchronous=NORMAL avoid an fsync stall
+        on every insert; busy_timeout keeps a second process (CLI,
+        tests) from erroring out immediately on a held write lock;
+        temp_store and mmap_size keep sort scratch and page reads off
+        the filesystem call path.
+        """
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("PRAGMA busy_timeout=5000")
+        self._conn.execute("PRAGMA temp_store=MEMORY")
+        self._conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
         self._conn.execute("""
             CREATE TABLE IF NOT EXISTS usage (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp TEXT NOT NULL,
+                timestamp INTEGER NOT NULL,
                 model TEXT NOT NULL,
                 tokens INTEGER NOT NULL,
-                cost REAL NOT NULL
+                cost INTEGER NOT NULL
             )
         """)
+        self._migrate_text_timestamps()
+        self._migrate_real_costs()
         self._conn.execute("""
-            CREATE INDEX IF NOT EXISTS idx_usage_timestamp
-            ON usage(timestamp)
+            CREATE INDEX IF NOT EXISTS idx_usage_ts_cost_tok
+            ON usage(timestamp, cost, tokens)
         """)
         self._conn.commit()
 
+    def _migrate_text_timestamps(self):
+        """One-shot rebuild of databases that stored ISO TEXT timestamps.
+
+        Legacy rows were written with datetime.now().isoformat() — naive
+        local time — so the 'utc' modifier tells strftime to treat them
+        as local when taking the epoch; without it every row would shift
+        by the host's UTC offset.
+        """
+        info = self._conn.execute("PRAGMA table_info(usage)").fetchall()
+        ts_type = next((col[2].upper() for col in info if col[1] == "timestamp"), None)
+        if ts_type != "TEXT":
+            return
+        self._conn.executescript("""
+            DROP INDEX IF EXISTS idx_usage_timestamp;
+            CREATE TABLE usage_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                cost INTEGER NOT NULL
+            );
+            INSERT INTO usage_new (id, timestamp, model, tokens, cost)
+                SELECT id, CAST(strftime('%s', timestamp, 'utc') AS INTEGER), model, tokens,
+                       CAST(ROUND(cost * 1000000) AS INTEGER)
+                FROM usage;
+            DROP TABLE usage;
+            ALTER TABLE usage_new RENAME TO usage;
+        """)
+        print("[Budget] Migrated usage timestamps from TEXT to INTEGER epoch")
+
+    def _migrate_real_costs(self):
+        """One-shot rebuild of databases that stored REAL dollar costs."""
+        info = self._conn.execute("PRAGMA table_info(usage)").fetchall()
+        cost_type = next((col[2].upper() for col in info if col[1] == "cost"), None)
+        if cost_type != "REAL":
+            return
+        self._conn.executescript("""
+            DROP INDEX IF EXISTS idx_usage_ts_cost_tok;
+            CREATE TABLE usage_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp INTEGER NOT NULL,
+                model TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                cost INTEGER NOT NULL
+            );
+            INSERT INTO usage_new (id, timestamp, model, tokens, cost)
+                SELECT id, timestamp, model, tokens,
+                       CAST(ROUND(cost * 1000000) AS INTEGER)
+                FROM usage;
+            DROP TABLE usage;
+            ALTER TABLE usage_new RENAME TO usage;
+        """)
+        print("[Budget] Migrated usage costs from REAL dollars to INTEGER micro-dollars")
+
     def _migrate_from_json(self):
         """One-time migration from legacy budget.json to SQLite."""
         if not os.path.exists(LEGACY_JSON):
             return
 
         try:
-            with open(LEGACY_JSON, "r") as f:
-                entries = json.load(f)
+            with open(LEGACY_JSON, "rb") as f:
+                entries = orjson.loads(f.read())
 
             if not entries:
                 return
@@ -79,10 +196,12 @@ class BudgetTracker:
             if cursor.fetchone()[0] > 0:
                 return
 
-            # Bulk insert
+            # Bulk insert (legacy JSON stored ISO timestamps)
             self._conn.executemany(
                 "INSERT INTO usage (timestamp, model, tokens, cost) VALUES (?, ?, ?, ?)",
-                [(e["timestamp"], e["model"], e["tokens"], e["cost"]) for e in entries]
+                [(int(datetime.fromisoformat(e["timestamp"]).timestamp()),
+                  e["model"], e["tokens"], int(round(e["cost"] * _COST_SCALE)))
+                 for e in entries]
             )
             self._conn.commit()
 
@@ -93,17 +212,67 @@ class BudgetTracker:
             print(f"[Budget] JSON migration skipped: {e}")
 
     def record_usage(self, model: str, tokens: int, cost: float | None = None):
-        """Record a completed request's token usage."""
+        """Record a completed request's token usage.
+
+        Rows are buffered in memory and committed in batches (by the
+        flush timer, an explicit flush(), or the next budget query), so
+        the request path never waits on an fsync.
+        """
         if cost is None:
             rate = MODEL_PRICING.get(model, MODEL_PRICING["default"])
             cost = (tokens / 1000) * rate
 
         with self._lock:
-            self._conn.execute(
-                "INSERT INTO usage (timestamp, model, tokens, cost) VALUES (?, ?, ?, ?)",
-                (datetime.now().isoformat(), model, tokens, cost)
-            )
-            self._conn.commit()
+            if self._buf is None:
+                self._buf = []
+            self._buf.append((int(time.time()), model, tokens,
+                              int(round(cost * _COST_SCALE))))
+            if len(self._buf) >= _FLUSH_THRESHOLD:
+                self._flush_locked()
+            elif self._flush_timer is None:
+                timer = threading.Timer(_FLUSH_INTERVAL, self._timed_flush)
+                timer.daemon = True
+                timer.start()
+                self._flush_timer = timer
+            if self._cache:
+                self._cache.clear()
+
+    def _flush_locked(self):
+        """Write buffered rows in one transaction. Caller holds the lock."""
+        if not self._buf:
+            return
+        # Explicit transaction so the whole batch is one write + fsync
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.executemany(_SQL_INSERT, self._buf)
+            self._conn.execute("COMMIT")
+        except sqlite3.Error:
+            self._conn.execute("ROLLBACK")
+            raise
+        self._buf.clear()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._flush_timer = None
+            self._flush_locked()
+
+    def flush(self):
+        """Flush any buffered usage rows to SQLite."""
+        with self._lock:
+            self._flush_locked()
+
+    def _cache_get(self, key: tuple):
+        """Return a cached value if present and fresh, else None."""
+        if self._cache is None:
+            self._cache = {}
+            return None
+        entry = self._cache.get(key)
+        if entry is not None and time.monotonic() < entry[0]:
+            return entry[1]
+        return None
+
+    def _cache_put(self, key: tuple, value):
+        self._cache[key] = (time.monotonic() + _CACHE_TTL, value)
 
     def estimate_cost(self, model: str, tokens: int) -> float:
         """Estimate cost for a pending request."""
@@ -112,49 +281,63 @@ class BudgetTracker:
 
     def get_spend(self, period: str = "daily") -> float:
         """Get total spend for a given period using indexed query."""
-        cutoff = self._get_cutoff(period).isoformat()
+        cached = self._cache_get(("spend", period))
+        if cached is not None:
+            return cached
+        cutoff = self._get_cutoff(period)
         with self._lock:
-            cursor = self._conn.execute(
-                "SELECT COALESCE(SUM(cost), 0) FROM usage WHERE timestamp >= ?",
-                (cutoff,)
-            )
-            return round(cursor.fetchone()[0], 6)
+            self._flush_locked()
+            cursor = self._conn.execute(_SQL_SUM_COST, (cutoff,))
+            value = cursor.fetchone()[0] / _COST_SCALE
+        self._cache_put(("spend", period), value)
+        return value
 
     def get_tokens(self, period: str = "daily") -> int:
         """Get total tokens for a given period."""
-        cutoff = self._get_cutoff(period).isoformat()
+        cached = self._cache_get(("tokens", period))
+        if cached is not None:
+            return cached
+        cutoff = self._get_cutoff(period)
         with self._lock:
-            cursor = self._conn.execute(
-                "SELECT COALESCE(SUM(tokens), 0) FROM usage WHERE timestamp >= ?",
-                (cutoff,)
-            )
-            return cursor.fetchone()[0]
+            self._flush_locked()
+            cursor = self._conn.execute(_SQL_SUM_TOKENS, (cutoff,))
+            value = cursor.fetchone()[0]
+        self._cache_put(("tokens", period), value)
+        return value
 
-    def _get_cutoff(self, period: str) -> datetime:
-        """Get the cutoff datetime for a given period."""
-        now = datetime.now()
+    def _get_cutoff(self, period: str) -> int:
+        """Get the cutoff unix timestamp for a given period."""
+        now = int(time.time())
         if period == "daily":
-            return now - timedelta(days=1)
+            return now - 86_400
         elif period == "weekly":
-            return now - timedelta(weeks=1)
+            return now - 7 * 86_400
         elif period == "monthly":
-            return now - timedelta(days=30)
-        return now - timedelta(days=1)
+            return now - 30 * 86_400
+        return now - 86_400
 
     def would_exceed_budget(self, rule: BudgetRule, additional_cost: float) -> tuple[bool, str | None]:
-        """Check if adding this cost would exceed any budget cap."""
+        """Check if adding this cost would exceed any budget cap.
+
+        Limits are global across models, so all three period checks are
+        served by one cached aggregate read — at most one lock
+        acquisition and one indexed scan per TTL window instead of
+        three, keeping Stage 3 off the lock under concurrent load.
+        """
         if not rule.enabled:
             return False, None
 
-        daily = self.get_spend("daily")
+        stats = self.get_stats()
+
+        daily = stats["daily_spend"]
         if daily + additional_cost > rule.daily_limit:
             return True, f"Daily limit ${rule.daily_limit:.2f} would be exceeded (current: ${daily:.2f})"
 
-        weekly = self.get_spend("weekly")
+        weekly = stats["weekly_spend"]
         if weekly + additional_cost > rule.weekly_limit:
             return True, f"Weekly limit ${rule.weekly_limit:.2f} would be exceeded (current: ${weekly:.2f})"
 
-        monthly = self.get_spend("monthly")
+        monthly = stats["monthly_spend"]
         if monthly + additional_cost > rule.monthly_limit:
             return True, f"Monthly limit ${rule.monthly_limit:.2f} would be exceeded (current: ${monthly:.2f})"
 
@@ -169,15 +352,39 @@ class BudgetTracker:
         return self.would_exceed_budget(rule, cost)
 
     def get_stats(self) -> dict:
-        """Get budget statistics for dashboard."""
-        return {
-            "daily_spend": self.get_spend("daily"),
-            "weekly_spend": self.get_spend("weekly"),
-            "monthly_spend": self.get_spend("monthly"),
-            "daily_tokens": self.get_tokens("daily"),
-            "weekly_tokens": self.get_tokens("weekly"),
+        """Get budget statistics for dashboard.
+
+        Runs one indexed scan bounded by the monthly cutoff with CASE
+        expressions instead of five separate SUM queries.
+        """
+        cached = self._cache_get(("stats",))
+        if cached is not None:
+            return cached
+
+        daily = self._get_cutoff("daily")
+        weekly = self._get_cutoff("weekly")
+        monthly = self._get_cutoff("monthly")
+        with self._lock:
+            self._flush_locked()
+            row = self._conn.execute(
+                _SQL_STATS, (daily, weekly, daily, weekly, monthly)
+            ).fetchone()
+
+        stats = {
+            "daily_spend": row[0] / _COST_SCALE,
+            "weekly_spend": row[1] / _COST_SCALE,
+            "monthly_spend": row[2] / _COST_SCALE,
+            "daily_tokens": row[3],
+            "weekly_tokens": row[4],
         }
+        self._cache_put(("stats",), stats)
+        return stats
 
     def close(self):
-        """Close the database connection."""
+        """Flush pending rows and close the database connection."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            self._flush_locked()
         self._conn.close()
@@ -1,7 +1,7 @@
 """Persistent configuration for The Prompt Firewall."""
 from __future__ import annotations
-import json
 import os
+import orjson
 from models import SecurityRules
 
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), "data", "config.json")
@@ -15,16 +15,16 @@ class Config:
     def _load(self):
         if os.path.exists(CONFIG_FILE):
             try:
-                with open(CONFIG_FILE, "r") as f:
-                    data = json.load(f)
+                with open(CONFIG_FILE, "rb") as f:
+                    data = orjson.loads(f.read())
                     self.rules = SecurityRules(**data)
-            except (json.JSONDecodeError, IOError, Exception):
+            except (orjson.JSONDecodeError, IOError, Exception):
                 self.rules = SecurityRules()
 
     def save(self):
         os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
-        with open(CONFIG_FILE, "w") as f:
-            json.dump(self.rules.model_dump(), f, indent=2)
+        with open(CONFIG_FILE, "wb") as f:
+            f.write(orjson.dumps(self.rules.model_dump(), option=orjson.OPT_INDENT_2))
 
     def update_rules(self, data: dict) -> SecurityRules:
         self.rules = SecurityRules(**data)
@@ -1 +1,45 @@
-# Detector modules for The Prompt Firewall
+"""Detector modules for The Prompt Firewall.
+
+`detect_all` runs the PII and injection detectors over a prompt with as
+few passes as the available engines allow: each detector is a single
+vectored Hyperscan scan where available, a single fused-alternation
+`finditer` otherwise. The two detectors are deliberately NOT fused into
+one alternation — `finditer` yields non-overlapping matches, so a
+combined pattern silently drops any PII span that starts inside an
+earlier injection match (an email inside a markdown-image URL, say),
+and that PII would then go upstream unredacted.
+
+The two detectors also deliberately run sequentially on one thread:
+typical prompts scan in microseconds, far below thread-pool handoff
+cost, and large bodies are already shipped wholesale to the
+interceptor's worker processes — splitting each scan across a thread
+pool would add latency to the common case to parallelize the case that
+is already off-loop.
+"""
+from __future__ import annotations
+
+from models import PIIMatch, InjectionMatch, PIIRule, InjectionRule
+from detectors import pii as _pii
+from detectors.pii import detect_pii
+from detectors.injection import detect_injection
+
+
+def precompile():
+    """Force-build every lazily compiled scan structure.
+
+    Called at rules-load time so compilation latency lands on config
+    updates rather than on the first request after one. The pattern
+    sets themselves are compiled at import; this only warms the
+    version-keyed rebuilds.
+    """
+    _pii._hs_prefilter()
+
+
+def detect_all(text: str, pii_rules: list[PIIRule],
+               injection_rule: InjectionRule) -> tuple[list[PIIMatch], list[InjectionMatch]]:
+    """Run both detectors over a prompt, one pass per detector.
+
+    Returns:
+        (pii_matches, injection_matches)
+    """
+    return detect_pii(text, pii_rules), detect_injection(text, injection_rule)
@@ -5,8 +5,15 @@ using pattern matching and heuristic analysis.
 """
 from __future__ import annotations
 import re
+import threading
+from bisect import bisect_right
 from models import InjectionMatch, InjectionRule, ThreatLevel, RuleAction
 
+try:
+    import hyperscan
+except ImportError:  # Hyperscan is optional — fall back to the re loop
+    hyperscan = None
+
 # Each pattern has: (compiled regex, base score, severity label)
 INJECTION_PATTERNS: list[tuple[re.Pattern, float, str, ThreatLevel]] = [
     # Direct instruction override
@@ -52,26 +59,105 @@ INJECTION_PATTERNS: list[tuple[re.Pattern, float, str, ThreatLevel]] = [
     # Markdown/HTML injection
     (re.compile(r'!\[.*?\]\(https?://.*?\)', re.IGNORECASE),
      0.5, "Markdown image injection", ThreatLevel.MEDIUM),
-
-    # Obfuscation via Unicode
-    (re.compile(r'[\u200b\u200c\u200d\u2060\ufeff]', re.IGNORECASE),
-     0.7, "Unicode obfuscation detected", ThreatLevel.HIGH),
 ]
 
+# Obfuscation via zero-width Unicode \u2014 checked with str.translate (one
+# C-level pass) instead of a regex alternative for 5 codepoints
+_ZW_TABLE = dict.fromkeys((0x200b, 0x200c, 0x200d, 0x2060, 0xfeff))
+
+
+# (score, description, severity) indexed by pattern id for the scan callback
+_PATTERN_META: tuple[tuple[float, str, ThreatLevel], ...] = tuple(
+    (score, description, severity)
+    for _, score, description, severity in INJECTION_PATTERNS
+)
+
+# One immutable InjectionMatch per pattern, built once at import.
+# A pattern hit always produces the same (description, score, severity)
+# triple, so detect_injection hands out these shared instances instead
+# of constructing a pydantic model per hit per request.
+_PATTERN_MATCHES: tuple[InjectionMatch, ...] = tuple(
+    InjectionMatch(pattern=description, score=score, severity=severity)
+    for score, description, severity in _PATTERN_META
+)
+
+_ZW_MATCH = InjectionMatch(
+    pattern="Unicode obfuscation detected", score=0.7, severity=ThreatLevel.HIGH
+)
+
+# All patterns fused into one alternation for the no-Hyperscan
+# fallback: the text is walked once instead of once per pattern. Each
+# alternative carries its pattern index in a named group.
+_FUSED_RE = re.compile(
+    "|".join(f"(?P<INJ{i}>{p.pattern})" for i, (p, _, _, _) in enumerate(INJECTION_PATTERNS)),
+    re.IGNORECASE,
+)
+
+
+def _build_hs_database():
+    """Compile all injection patterns into a single Hyperscan database.
+
+    Hyperscan scans the text once for all patterns instead of one
+    backtracking re.search per pattern. Returns None if Hyperscan is
+    unavailable or any pattern fails to compile.
+    """
+    if hyperscan is None:
+        return None
+    # Hyperscan's PCRE dialect spells unicode escapes \x{...}, not \uXXXX
+    expressions = [
+        re.sub(r"\\u([0-9a-fA-F]{4})", r"\\x{\1}", p.pattern).encode()
+        for p, _, _, _ in INJECTION_PATTERNS
+    ]
+    flags = [
+        hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_UTF8
+    ] * len(expressions)
+    db = hyperscan.Database()
+    try:
+        db.compile(expressions=expressions, ids=list(range(len(expressions))), flags=flags)
+    except Exception:
+        return None
+    return db
+
+
+_HS_DB = _build_hs_database()
+_hs_local = threading.local()  # scratch buffers are not thread-safe
+
+
+def _get_scratch():
+    scratch = getattr(_hs_local, "scratch", None)
+    if scratch is None:
+        scratch = hyperscan.Scratch(_HS_DB)
+        _hs_local.scratch = scratch
+    return scratch
+
 
 def detect_injection(text: str, rule: InjectionRule) -> list[InjectionMatch]:
     """Scan text for injection patterns. Returns all pattern matches."""
     if not rule.enabled:
         return []
 
-    matches: list[InjectionMatch] = []
-    for pattern, score, description, severity in INJECTION_PATTERNS:
-        if pattern.search(text):
-            matches.append(InjectionMatch(
-                pattern=description,
-                score=score,
-                severity=severity,
-            ))
+    if _HS_DB is not None:
+        hit_ids: set[int] = set()
+        _HS_DB.scan(
+            text.encode(),
+            match_event_handler=lambda id, frm, to, flags, ctx: hit_ids.add(id),
+            scratch=_get_scratch(),
+        )
+        matches = [_PATTERN_MATCHES[pattern_id] for pattern_id in sorted(hit_ids)]
+    else:
+        # Fallback: single pass with the fused alternation
+        hit_ids = set()
+        for m in _FUSED_RE.finditer(text):
+            group = m.lastgroup
+            if group is None:
+                # An inner unnamed group matched last — find the
+                # top-level alternative that actually fired.
+                group = next(g for g, v in m.groupdict().items() if v is not None)
+            hit_ids.add(int(group[3:]))
+        matches = [_PATTERN_MATCHES[pattern_id] for pattern_id in sorted(hit_ids)]
+
+    if len(text.translate(_ZW_TABLE)) != len(text):
+        matches.append(_ZW_MATCH)
     return matches
 
 
@@ -85,17 +171,20 @@ def compute_threat_score(matches: list[InjectionMatch]) -> float:
     return min(1.0, max_score + diversity_bonus)
 
 
+# Score → level as a 101-entry lookup table indexed by int(score*100).
+# The thresholds (0.4 / 0.6 / 0.8) sit exactly on bucket boundaries,
+# so flooring into a bucket gives the same answer as comparing against
+# them — one index load instead of a comparison chain per score.
+_THRESHOLDS = (0.4, 0.6, 0.8)
+_LEVELS = (ThreatLevel.LOW, ThreatLevel.MEDIUM, ThreatLevel.HIGH, ThreatLevel.CRITICAL)
+_LEVEL_TABLE = tuple(_LEVELS[bisect_right(_THRESHOLDS, i / 100)] for i in range(101))
+
+
 def get_threat_level(score: float) -> ThreatLevel:
     """Map a numeric score to a ThreatLevel enum."""
-    if score >= 0.8:
-        return ThreatLevel.CRITICAL
-    elif score >= 0.6:
-        return ThreatLevel.HIGH
-    elif score >= 0.4:
-        return ThreatLevel.MEDIUM
-    elif score > 0.0:
-        return ThreatLevel.LOW
-    return ThreatLevel.NONE
+    if score <= 0.0:
+        return ThreatLevel.NONE
+    return _LEVEL_TABLE[min(100, int(score * 100))]
 
 
 def should_block_injection(matches: list[InjectionMatch], rule: InjectionRule) -> bool:
@@ -104,3 +193,27 @@ def should_block_injection(matches: list[InjectionMatch], rule: InjectionRule) -
         return False
     score = compute_threat_score(matches)
     return score >= rule.threshold
+
+
+def evaluate_matches(matches: list[InjectionMatch],
+                     rule: InjectionRule) -> tuple[float, ThreatLevel, bool]:
+    """Score matches and derive threat level + block decision in one walk.
+
+    Folds compute_threat_score / get_threat_level / should_block_injection
+    into a single traversal of the match list for the interceptor's
+    per-request path. The standalone functions remain for callers that
+    only need one of the pieces.
+
+    Returns:
+        (score, threat_level, should_block)
+    """
+    if not matches:
+        return 0.0, ThreatLevel.NONE, False
+    max_score = 0.0
+    for m in matches:
+        if m.score > max_score:
+            max_score = m.score
+    score = min(1.0, max_score + min(0.1, len(matches) * 0.02))
+    level = _LEVEL_TABLE[min(100, int(score * 100))]
+    block = rule.enabled and rule.action == RuleAction.BLOCK and score >= rule.threshold
+    return score, level, block
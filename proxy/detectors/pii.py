@@ -4,17 +4,35 @@ Detects and redacts personally identifiable information from prompts
 before they leave the user's machine.
 
 Supports built-in patterns + user-defined custom regex patterns.
+
+Engine choice: linear-time engines (RE2, plain-mode Hyperscan) cannot
+host these patterns — the phone pattern needs lookarounds — so exact
+matching stays on `re` via the fused alternation, with Hyperscan in
+prefilter mode (which relaxes those constructs without false negatives)
+providing the vectored reject-fast pass.
 """
 from __future__ import annotations
 import re
+import sys
+import threading
+from functools import lru_cache
 from models import PIIType, PIIMatch, PIIRule, RuleAction
 
+try:
+    import hyperscan
+except ImportError:  # Hyperscan is optional — detection runs on re alone
+    hyperscan = None
+
 
 # Compiled regex patterns for each PII type
 PII_PATTERNS: dict[PIIType, re.Pattern] = {
     PIIType.EMAIL: re.compile(
         r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}\b'
     ),
+    # Digit-run validation (reject bare 7-digit numbers, longer runs)
+    # is done by the shape + lookarounds here, inside the engine's C
+    # loop — there is deliberately no Python-level per-character
+    # post-filter on this path.
     PIIType.PHONE: re.compile(
         r'(?<!\d)(?:\+?1[-.\s]?)?\(?\d{3}\)?[-.\s]\d{3}[-.\s]?\d{4}(?!\d)'
     ),
@@ -38,8 +56,175 @@ REDACTION_LABELS: dict[PIIType, str] = {
 }
 
 # ─── Custom PII Patterns ──────────────────────────────────────
-# User-defined patterns: list of {name, pattern, redaction_label}
-_custom_patterns: list[dict] = []
+# User-defined patterns held as parallel arrays (SoA) so iteration is
+# plain indexed list loads instead of a dict lookup per entry.
+_custom_names: list[str] = []
+_custom_compiled: list[re.Pattern] = []
+_custom_labels: list[str] = []
+
+# ─── Fused Scan Pattern ───────────────────────────────────────
+# All built-in + custom patterns combined into one alternation with
+# named groups, so detect_pii makes a single pass over the text
+# instead of one finditer pass per pattern.
+_fused_pattern: re.Pattern | None = None
+# group name → (pii_type, redaction label, is_custom)
+_fused_dispatch: dict[str, tuple[PIIType, str, bool]] = {}
+# group name → raw pattern source (feeds the Hyperscan prefilter)
+_group_sources: dict[str, str] = {}
+# Bumped on every rebuild so callers can key caches on the pattern set
+_patterns_version = 0
+
+
+def patterns_version() -> int:
+    """Monotonic counter incremented whenever the pattern set changes."""
+    return _patterns_version
+
+
+def _rebuild_fused_pattern():
+    """Recompile the fused alternation from built-in + custom patterns."""
+    global _fused_pattern, _fused_dispatch, _group_sources, _patterns_version
+    _patterns_version += 1
+    parts: list[str] = []
+    dispatch: dict[str, tuple[PIIType, str, bool]] = {}
+    sources: dict[str, str] = {}
+
+    for pii_type, pattern in PII_PATTERNS.items():
+        group = pii_type.name
+        parts.append(f"(?P<{group}>{pattern.pattern})")
+        dispatch[group] = (pii_type, REDACTION_LABELS[pii_type], False)
+        sources[group] = pattern.pattern
+
+    for i, compiled in enumerate(_custom_compiled):
+        group = f"CUSTOM{i}"
+        parts.append(f"(?P<{group}>{compiled.pattern})")
+        dispatch[group] = (PIIType.EMAIL, _custom_labels[i], True)
+        sources[group] = compiled.pattern
+
+    _fused_pattern = re.compile("|".join(parts))
+    _fused_dispatch = dispatch
+    _group_sources = sources
+
+
+_rebuild_fused_pattern()
+
+# Every built-in pattern requires an '@' or a digit somewhere in the
+# text. A single character-class search (one C-level memory scan) is
+# far cheaper than any regex engine, so PII-free prose short-circuits
+# before the detectors run at all. Only valid when no custom patterns
+# are registered — those can match anything.
+_candidate_search = re.compile(r"[@0-9]").search
+
+# ─── Hyperscan Prefilter ──────────────────────────────────────
+# Most prompts contain no PII. A single vectored Hyperscan scan in
+# prefilter mode (no false negatives, possible false positives) decides
+# whether the re alternation needs to run at all; the re pass is still
+# the source of truth for exact spans and values.
+_hs_db = None
+_hs_complete = False  # True when every pattern made it into the DB
+_hs_version = -1
+_hs_local = threading.local()  # scratch buffers are not thread-safe
+
+
+def _hs_prefilter():
+    """Return the prefilter database for the current pattern set.
+
+    Returns None when Hyperscan is unavailable or any pattern failed to
+    compile even in prefilter mode (a partial DB could produce false
+    negatives, so it is all-or-nothing).
+    """
+    global _hs_db, _hs_complete, _hs_version
+    if _hs_version != _patterns_version:
+        _hs_version = _patterns_version
+        _hs_db = None
+        _hs_complete = False
+        _hs_local.__dict__.clear()
+        if hyperscan is not None:
+            # Hyperscan spells unicode escapes \x{...}, not \uXXXX
+            expressions = [
+                re.sub(r"\\u([0-9a-fA-F]{4})", r"\\x{\1}", source).encode()
+                for source in _group_sources.values()
+            ]
+            flags = [
+                hyperscan.HS_FLAG_PREFILTER | hyperscan.HS_FLAG_SINGLEMATCH | hyperscan.HS_FLAG_UTF8
+            ] * len(expressions)
+            db = hyperscan.Database()
+            try:
+                db.compile(expressions=expressions, ids=list(range(len(expressions))), flags=flags)
+            except Exception:
+                return None
+            _hs_db = db
+            _hs_complete = True
+    return _hs_db if _hs_complete else None
+
+
+def _hs_scratch(db):
+    scratch = getattr(_hs_local, "scratch", None)
+    if scratch is None:
+        scratch = hyperscan.Scratch(db)
+        _hs_local.scratch = scratch
+    return scratch
+
+
+def _hs_any_match(text: str) -> bool:
+    """One vectored pass: could any PII pattern match this text?"""
+    db = _hs_prefilter()
+    if db is None:
+        return True  # no prefilter available — assume yes
+    hits: list = []
+    db.scan(
+        text.encode(),
+        match_event_handler=lambda id, frm, to, flags, ctx: hits.append(id),
+        scratch=_hs_scratch(db),
+    )
+    return bool(hits)
+
+
+def prefilter_bytes(buf: bytes) -> bool:
+    """Could any PII pattern match somewhere in this raw byte buffer?
+
+    Lets callers reject PII-free JSON bodies without decoding or
+    extracting text first. False positives are fine (the caller falls
+    through to the exact scan); False means a guaranteed miss —
+    assuming the PII content itself is not \\uXXXX-escaped in the JSON,
+    which standard serializers never do for the ASCII these patterns
+    match. Returns True when no prefilter database is available.
+    """
+    db = _hs_prefilter()
+    if db is None:
+        return True
+    hits: list = []
+    db.scan(
+        buf,
+        match_event_handler=lambda id, frm, to, flags, ctx: hits.append(id),
+        scratch=_hs_scratch(db),
+    )
+    return bool(hits)
+
+
+# Last (rules list, enabled frozenset) pair — rule lists are reused
+# across requests, so an identity hit skips rebuilding the set per call
+_enabled_memo: tuple[list, frozenset] | None = None
+
+
+def _enabled_types(rules: list[PIIRule]) -> frozenset:
+    """Frozenset of enabled PII types, memoized on rule-list identity."""
+    global _enabled_memo
+    memo = _enabled_memo
+    if memo is not None and memo[0] is rules:
+        return memo[1]
+    enabled = frozenset(r.pii_type for r in rules if r.enabled)
+    _enabled_memo = (rules, enabled)
+    return enabled
+
+
+@lru_cache(maxsize=256)
+def _compile(pattern: str) -> re.Pattern:
+    """Compiled form of a custom pattern.
+
+    Rules saves re-add the same custom patterns each time; caching here
+    skips the regex parse + NFA build on every re-add.
+    """
+    return re.compile(pattern)
 
 
 def add_custom_pattern(name: str, pattern: str, label: str = None) -> bool:
@@ -54,77 +239,130 @@ def add_custom_pattern(name: str, pattern: str, label: str = None) -> bool:
         True if added, False if regex is invalid.
     """
     try:
-        compiled = re.compile(pattern)
+        # Interned sources make the cache lookup a pointer compare and
+        # dedupe identical pattern strings across re-adds
+        compiled = _compile(sys.intern(pattern))
     except re.error:
         return False
 
     if label is None:
         label = f"[{name.upper()}_REDACTED]"
 
-    _custom_patterns.append({
-        "name": name,
-        "pattern": compiled,
-        "label": label,
-    })
+    _custom_names.append(name)
+    _custom_compiled.append(compiled)
+    _custom_labels.append(label)
+    try:
+        _rebuild_fused_pattern()
+    except re.error:
+        # Pattern is valid standalone but breaks the fused alternation
+        # (e.g., numbered backreferences) — reject it.
+        _custom_names.pop()
+        _custom_compiled.pop()
+        _custom_labels.pop()
+        _rebuild_fused_pattern()
+        return False
     return True
 
 
 def remove_custom_pattern(name: str) -> bool:
     """Remove a custom pattern by name."""
-    global _custom_patterns
-    before = len(_custom_patterns)
-    _custom_patterns = [p for p in _custom_patterns if p["name"] != name]
-    return len(_custom_patterns) < before
+    try:
+        i = _custom_names.index(name)
+    except ValueError:
+        return False
+    _custom_names.pop(i)
+    _custom_compiled.pop(i)
+    _custom_labels.pop(i)
+    _rebuild_fused_pattern()
+    return True
 
 
 def get_custom_patterns() -> list[dict]:
     """Return currently registered custom patterns (serializable)."""
     return [
-        {"name": p["name"], "pattern": p["pattern"].pattern, "label": p["label"]}
-        for p in _custom_patterns
+        {"name": _custom_names[i], "pattern": _custom_compiled[i].pattern, "label": _custom_labels[i]}
+        for i in range(len(_custom_names))
     ]
 
 
+def _valid_ssn(value: str) -> bool:
+    """Structural post-filter for SSN-shaped matches.
+
+    Rejects never-issued numbers (area 000/666/9xx, group 00, serial
+    0000) so things like 000-12-3456 don't count as PII.
+    """
+    area, group, serial = value.split("-")
+    return (area != "000" and area != "666" and area[0] != "9"
+            and group != "00" and serial != "0000")
+
+
 def detect_pii(text: str, rules: list[PIIRule]) -> list[PIIMatch]:
-    """Scan text for PII based on active rules + custom patterns."""
+    """Scan text for PII based on active rules + custom patterns.
+
+    A Hyperscan prefilter pass (when available) rejects PII-free text
+    outright; otherwise a single pass with the fused alternation
+    dispatches each hit on its named group. Disabled types are filtered
+    from the results rather than recompiled out of the pattern.
+    Custom patterns are always active if registered.
+    """
+    if not _custom_names and _candidate_search(text) is None:
+        return []
+    if not _hs_any_match(text):
+        return []
+
     matches: list[PIIMatch] = []
-    enabled_types = {r.pii_type for r in rules if r.enabled}
+    enabled_types = _enabled_types(rules)
 
-    # Built-in patterns
-    for pii_type, pattern in PII_PATTERNS.items():
-        if pii_type not in enabled_types:
+    for m in _fused_pattern.finditer(text):
+        group = m.lastgroup
+        if group not in _fused_dispatch:
+            # A custom pattern's inner named group matched last — find
+            # the top-level alternative that actually fired.
+            group = next(g for g in _fused_dispatch if m.group(g) is not None)
+        pii_type, label, is_custom = _fused_dispatch[group]
+        if not is_custom and pii_type not in enabled_types:
+            continue
+        if not is_custom and pii_type == PIIType.SSN and not _valid_ssn(m.group()):
             continue
-        for m in pattern.finditer(text):
-            matches.append(PIIMatch(
-                pii_type=pii_type,
-                value=m.group(),
-                redacted=REDACTION_LABELS[pii_type],
-                position=(m.start(), m.end()),
-            ))
-
-    # Custom patterns (always active if registered)
-    for custom in _custom_patterns:
-        for m in custom["pattern"].finditer(text):
-            matches.append(PIIMatch(
-                pii_type=PIIType.EMAIL,  # Use EMAIL as generic for custom
-                value=m.group(),
-                redacted=custom["label"],
-                position=(m.start(), m.end()),
-            ))
+        matches.append(PIIMatch(
+            pii_type=pii_type,  # customs use EMAIL as generic type
+            value=m.group(),
+            redacted=label,
+            position=(m.start(), m.end()),
+        ))
 
     return matches
 
 
 def redact_pii(text: str, matches: list[PIIMatch]) -> str:
     """Replace all detected PII in text with redaction labels.
-    Processes matches in reverse order to preserve positions.
+
+    Builds the result in one left-to-right pass and a single join, so
+    total copying is O(len(text)) instead of one full string rebuild
+    per match. Matches overlapping an already-redacted span are skipped.
+    The slicing and join run in C already; a native/JIT rewrite of this
+    loop would only re-buy that at the cost of a compiler dependency.
     """
-    sorted_matches = sorted(matches, key=lambda m: m.position[0], reverse=True)
-    result = text
-    for match in sorted_matches:
+    if not matches:
+        return text
+    segments: list[str] = []
+    cursor = 0
+    prev_start = -1
+    for match in matches:
         start, end = match.position
-        result = result[:start] + match.redacted + result[end:]
-    return result
+        if start < prev_start:
+            # detect_pii emits matches in ascending start order
+            # (finditer walks left to right); only a caller-supplied
+            # unordered list ever pays for the sort + retry.
+            return redact_pii(text, sorted(matches, key=lambda m: m.position[0]))
+        prev_start = start
+        if start < cursor:
+            continue
+        segments.append(text[cursor:start])
+        segments.append(match.redacted)
+        cursor = end
+    segments.append(text[cursor:])
+    return "".join(segments)
 
 
 def should_block(matches: list[PIIMatch], rules: list[PIIRule]) -> bool:
@@ -6,49 +6,223 @@ Processes every request through the security pipeline:
 3. Budget Check (with tiktoken-accurate token counting)
 """
 from __future__ import annotations
-import json
+import asyncio
+import hashlib
+import os
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import msgspec
+import orjson
+
 from models import (
-    TrafficEntry, ThreatLevel, SecurityRules
+    TrafficEntry, ThreatLevel, SecurityRules, PIIRule, InjectionRule,
+    PIIMatch, InjectionMatch
 )
-from detectors.pii import detect_pii, redact_pii, should_block as pii_should_block
-from detectors.injection import (
-    detect_injection, compute_threat_score,
-    get_threat_level, should_block_injection
+from detectors import detect_all, precompile
+from detectors.pii import (
+    detect_pii, redact_pii, should_block as pii_should_block,
+    patterns_version as pii_patterns_version,
+    prefilter_bytes as pii_prefilter_bytes,
 )
+from detectors.injection import evaluate_matches
 from budget import BudgetTracker
 from tokenizer import count_tokens
 
+# Prompts above this size are scanned in a worker process so the regex
+# work doesn't block the event loop under the GIL.
+SCAN_OFFLOAD_THRESHOLD = 8192
+
+# Repeated prompts (system prompts, retries, test harnesses) skip the
+# detectors entirely via a capped scan-result cache.
+SCAN_CACHE_SIZE = 4096
+
+# Typed views over the request/response JSON. msgspec decodes only the
+# fields named here and skips building dicts/lists for everything else
+# (tool schemas, base64 images, logprobs, ...), which is the bulk of a
+# large chat payload. The full-dict decode now happens only on the rare
+# redaction path that has to rewrite the body.
+class _Msg(msgspec.Struct):
+    role: str = ""
+    content: object = None  # str, or content blocks we scan text parts of
+
+
+class _Req(msgspec.Struct):
+    model: str = "unknown"
+    messages: list[_Msg] = []
+    # prompt/input may legally be a list of strings (OpenAI completions,
+    # embeddings); stream stays untyped so an off-type value degrades to
+    # truthiness instead of failing the whole decode
+    prompt: str | list[str] = ""
+    input: str | list[str] = ""
+    stream: object = False
+
+
+class _RespMsg(msgspec.Struct):
+    content: object = None
+
+
+class _Choice(msgspec.Struct):
+    message: _RespMsg | None = None
+
+
+class _Usage(msgspec.Struct):
+    total_tokens: int | None = None
+
+
+class _Resp(msgspec.Struct):
+    usage: _Usage | None = None
+    choices: list[_Choice] = []
+    response: str = ""
+
+
+_REQ_DECODER = msgspec.json.Decoder(_Req)
+_RESP_DECODER = msgspec.json.Decoder(_Resp)
+
+_executor: ProcessPoolExecutor | None = None
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    """Lazily create the shared detector process pool."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _executor
+
+
+def shutdown_executor():
+    """Shut down the detector process pool (server teardown)."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def _scan_prompt(text: str, pii_rules: list[PIIRule],
+                 injection_rule: InjectionRule) -> tuple[list[PIIMatch], list[InjectionMatch]]:
+    """Run both detectors over a prompt. Module-level so it pickles
+    cleanly into pool workers; forked workers inherit the compiled
+    patterns."""
+    return detect_all(text, pii_rules, injection_rule)
+
 
 class Interceptor:
     def __init__(self, rules: SecurityRules, budget_tracker: BudgetTracker):
         self.rules = rules
         self.budget = budget_tracker
+        # prompt-hash → (pii matches, injection matches); keys embed the
+        # rules/pattern versions so stale entries simply stop matching
+        self._scan_cache: OrderedDict[tuple, tuple] = OrderedDict()
+        self._rules_version = 0
+        precompile()
 
     def update_rules(self, rules: SecurityRules):
         self.rules = rules
+        self._rules_version += 1
+        precompile()
+
+    def _scan_key(self, prompt_text: str) -> tuple:
+        digest = hashlib.blake2b(prompt_text.encode(), digest_size=16).digest()
+        return (digest, self._rules_version, pii_patterns_version())
+
+    def _scan_cache_get(self, key: tuple) -> tuple[list[PIIMatch], list[InjectionMatch]] | None:
+        hit = self._scan_cache.get(key)
+        if hit is None:
+            return None
+        self._scan_cache.move_to_end(key)
+        # Hand out fresh lists — callers attach these to TrafficEntry,
+        # which may be extended with response matches later.
+        return list(hit[0]), list(hit[1])
+
+    def _scan_cache_put(self, key: tuple, pii_matches: list[PIIMatch],
+                        injection_matches: list[InjectionMatch]):
+        self._scan_cache[key] = (tuple(pii_matches), tuple(injection_matches))
+        if len(self._scan_cache) > SCAN_CACHE_SIZE:
+            self._scan_cache.popitem(last=False)
 
     def process_request(self, body: bytes, endpoint: str) -> tuple[bytes, TrafficEntry]:
         """Process an outgoing request through the security pipeline.
-        
+
+        The clean path never round-trips the body: parsing is a typed
+        partial decode of only the fields the pipeline reads, and the
+        original bytes are returned untouched unless a redaction
+        actually rewrote the prompt (the one case that pays for a full
+        decode + re-serialize).
+
         Returns:
             tuple: (modified_body, traffic_entry)
             If traffic_entry.blocked is True, the request should not be forwarded.
         """
+        entry, data, prompt_text, model = self._parse(body, endpoint)
+
+        key = self._scan_key(prompt_text)
+        cached = self._scan_cache_get(key)
+        if cached is not None:
+            pii_matches, injection_matches = cached
+        else:
+            pii_matches, injection_matches = detect_all(
+                prompt_text, self.rules.pii_rules, self.rules.injection_rule
+            )
+            self._scan_cache_put(key, pii_matches, injection_matches)
+        return self._apply_results(body, data, prompt_text, model, entry,
+                                   pii_matches, injection_matches)
+
+    async def process_request_async(self, body: bytes, endpoint: str) -> tuple[bytes, TrafficEntry]:
+        """Async variant of process_request for the proxy event loop.
+
+        Large prompts are scanned in a worker process via the shared
+        executor so concurrent requests aren't stalled by regex work.
+        """
+        entry, data, prompt_text, model = self._parse(body, endpoint)
+
+        key = self._scan_key(prompt_text)
+        cached = self._scan_cache_get(key)
+        if cached is not None:
+            pii_matches, injection_matches = cached
+        elif len(prompt_text) > SCAN_OFFLOAD_THRESHOLD:
+            loop = asyncio.get_running_loop()
+            pii_matches, injection_matches = await loop.run_in_executor(
+                _get_executor(), _scan_prompt,
+                prompt_text, self.rules.pii_rules, self.rules.injection_rule
+            )
+            self._scan_cache_put(key, pii_matches, injection_matches)
+        else:
+            pii_matches, injection_matches = detect_all(
+                prompt_text, self.rules.pii_rules, self.rules.injection_rule
+            )
+            self._scan_cache_put(key, pii_matches, injection_matches)
+
+        return self._apply_results(body, data, prompt_text, model, entry,
+                                   pii_matches, injection_matches)
+
+    def _parse(self, body: bytes, endpoint: str) -> tuple[TrafficEntry, _Req | None, str, str]:
+        """Decode the request body and extract prompt text + model."""
         entry = TrafficEntry(endpoint=endpoint)
 
         try:
-            data = json.loads(body)
-        except (json.JSONDecodeError, UnicodeDecodeError):
-            return body, entry
+            req = _REQ_DECODER.decode(body)
+        except msgspec.DecodeError:
+            # A body the typed decode rejects (off-type field, shape we
+            # don't model) must still be scanned — forwarding it
+            # untouched would let any stray field the upstream tolerates
+            # bypass the firewall. data=None tells _apply_results the
+            # body can't be structurally rewritten (no redaction), but
+            # detection and blocking still apply.
+            text = body.decode("utf-8", "replace")
+            entry.prompt_preview = text[:150] + ("..." if len(text) > 150 else "")
+            return entry, None, text, "unknown"
 
-        # Extract prompt text
-        prompt_text = self._extract_prompt(data)
-        model = data.get("model", "unknown")
+        prompt_text, entry.prompt_preview = self._extract_prompt_and_preview(req, body)
+        model = req.model
         entry.model = model
-        entry.prompt_preview = prompt_text[:150] + ("..." if len(prompt_text) > 150 else "")
+        entry.is_streaming = bool(req.stream)
+        return entry, req, prompt_text, model
 
+    def _apply_results(self, body: bytes, data: _Req | None, prompt_text: str, model: str,
+                       entry: TrafficEntry, pii_matches: list[PIIMatch],
+                       injection_matches: list[InjectionMatch]) -> tuple[bytes, TrafficEntry]:
+        """Apply detector results: block/redact, score threats, check budget."""
         # === Stage 1: PII Detection ===
-        pii_matches = detect_pii(prompt_text, self.rules.pii_rules)
         entry.pii_detected = pii_matches
 
         if pii_matches:
@@ -58,20 +232,27 @@ class Interceptor:
                 entry.threat_level = ThreatLevel.HIGH
                 return body, entry
 
-            # Redact PII in the prompt
+            # Redact PII in the prompt — only this path needs the full
+            # dict decode + re-serialize, so pay for it here, not in
+            # _parse. data=None marks a raw-scanned body that can't be
+            # structurally rewritten, so it goes upstream as-is.
             redacted_text = redact_pii(prompt_text, pii_matches)
-            data = self._replace_prompt(data, redacted_text)
-            body = json.dumps(data).encode()
+            if redacted_text != prompt_text and data is not None:
+                full = orjson.loads(body)
+                if self._replace_prompt(full, redacted_text):
+                    body = orjson.dumps(full)
+                    # Budget estimation below should count what actually
+                    # goes upstream, and redaction labels change the length
+                    prompt_text = redacted_text
 
         # === Stage 2: Injection Detection ===
-        injection_matches = detect_injection(prompt_text, self.rules.injection_rule)
         entry.injection_detected = injection_matches
 
         if injection_matches:
-            score = compute_threat_score(injection_matches)
-            entry.threat_level = get_threat_level(score)
-
-            if should_block_injection(injection_matches, self.rules.injection_rule):
+            score, entry.threat_level, block = evaluate_matches(
+                injection_matches, self.rules.injection_rule
+            )
+            if block:
                 entry.blocked = True
                 entry.block_reason = f"Injection detected (score: {score:.2f}): {injection_matches[0].pattern}"
                 return body, entry
@@ -92,16 +273,28 @@ class Interceptor:
 
     def process_response(self, body: bytes, entry: TrafficEntry) -> TrafficEntry:
         """Process a response to extract token usage, cost, and scan for leaked PII."""
+        if entry.is_streaming:
+            # SSE bodies are a stream of "data: ..." frames, not one JSON
+            # document — the decode below could only ever fail. Account
+            # with the request-time token estimate instead.
+            entry.cost = self.budget.estimate_cost(entry.model, entry.tokens_used)
+            self.budget.record_usage(entry.model, entry.tokens_used, entry.cost)
+            return entry
+
         try:
-            data = json.loads(body)
-            usage = data.get("usage", {})
-            tokens = usage.get("total_tokens", entry.tokens_used)
+            resp = _RESP_DECODER.decode(body)
+            tokens = entry.tokens_used
+            if resp.usage is not None and resp.usage.total_tokens is not None:
+                tokens = resp.usage.total_tokens
             entry.tokens_used = tokens
             entry.cost = self.budget.estimate_cost(entry.model, tokens)
             self.budget.record_usage(entry.model, tokens, entry.cost)
 
             # === Response PII Scanning ===
-            response_text = self._extract_response_text(data)
+            # One vectored pass over the raw bytes first: a clean body
+            # (the common case) skips text extraction and the exact
+            # scan entirely.
+            response_text = self._extract_response_text(resp) if pii_prefilter_bytes(body) else ""
             if response_text:
                 resp_pii = detect_pii(response_text, self.rules.pii_rules)
                 if resp_pii:
@@ -112,59 +305,113 @@ class Interceptor:
                     if entry.threat_level == ThreatLevel.NONE:
                         entry.threat_level = ThreatLevel.LOW
 
-        except (json.JSONDecodeError, UnicodeDecodeError):
+        except msgspec.DecodeError:
             pass
         return entry
 
-    def _extract_response_text(self, data: dict) -> str:
+    def _extract_response_text(self, resp: _Resp) -> str:
         """Extract text content from AI API response."""
         # OpenAI chat format
-        choices = data.get("choices", [])
-        if choices:
+        if resp.choices:
             texts = []
-            for choice in choices:
-                msg = choice.get("message", {})
-                content = msg.get("content", "")
-                if content:
-                    texts.append(content)
+            for choice in resp.choices:
+                msg = choice.message
+                if msg is not None and isinstance(msg.content, str) and msg.content:
+                    texts.append(msg.content)
             return " ".join(texts)
 
         # Ollama format
-        if "response" in data:
-            return data["response"]
+        return resp.response
 
-        return ""
+    def _extract_prompt_and_preview(self, req: _Req, body: bytes) -> tuple[str, str]:
+        """Extract the user's prompt and its dashboard preview.
 
-    def _extract_prompt(self, data: dict) -> str:
-        """Extract the user's prompt from various API formats."""
-        # OpenAI chat format
-        messages = data.get("messages", [])
-        if messages:
-            user_msgs = [m.get("content", "") for m in messages if m.get("role") == "user"]
-            return " ".join(user_msgs)
+        The preview samples only the head of the first user message, so
+        building it is O(1) in conversation size — huge multi-turn
+        bodies aren't walked twice just for 150 display characters.
 
-        # Simple prompt format
-        if "prompt" in data:
-            return data["prompt"]
+        There is intentionally no per-provider dispatch here: the
+        common providers spell their prompt as one of the three field
+        shapes the typed decoder already extracts (messages / prompt /
+        input), and bodies without any of them hit the raw-text
+        fallback below, so generated per-provider fast paths would
+        specialize away branches this method no longer has.
+        """
+        # OpenAI chat format. Empty contents are skipped so the
+        # detectors and tokenizer don't chew on padding spaces.
+        if req.messages:
+            contents: list[str] = []
+            for m in req.messages:
+                if m.role != "user":
+                    continue
+                if isinstance(m.content, str):
+                    if m.content:
+                        contents.append(m.content)
+                elif isinstance(m.content, list):
+                    # Anthropic / OpenAI-vision content blocks: the
+                    # text parts carry the prompt (image and tool
+                    # blocks have none).
+                    contents.extend(
+                        part["text"] for part in m.content
+                        if isinstance(part, dict) and isinstance(part.get("text"), str)
+                        and part["text"]
+                    )
+            if not contents:
+                return "", ""
+            first = contents[0]
+            preview = first[:150] + ("..." if len(first) > 150 or len(contents) > 1 else "")
+            return " ".join(contents) if len(contents) > 1 else first, preview
 
-        # Ollama format
-        if "input" in data:
-            return data["input"]
+        # Simple prompt format; prompt/input may be a list of strings
+        # (completions, embeddings)
+        text = req.prompt or req.input  # req.input is the Ollama spelling
+        if isinstance(text, list):
+            text = " ".join(text)
+        if text:
+            return text, text[:150] + ("..." if len(text) > 150 else "")
 
-        return json.dumps(data)
+        # Unrecognized shape (e.g. Gemini "contents") — scan the raw
+        # JSON text so prompts the typed decoder doesn't know about
+        # still go through the detectors instead of upstream unscanned.
+        # The patterns match on content; the field names and quoting
+        # around it are noise they ignore.
+        text = body.decode("utf-8", "replace")
+        return text, text[:150] + ("..." if len(text) > 150 else "")
 
-    def _replace_prompt(self, data: dict, new_text: str) -> dict:
-        """Replace the prompt text in the request body."""
+    def _replace_prompt(self, data: dict, new_text: str) -> bool:
+        """Replace the prompt text in the request body in place.
+
+        Returns True if anything actually changed, so callers can skip
+        re-serializing an unmodified body.
+        """
+        changed = False
         messages = data.get("messages", [])
         if messages:
+            # Only plain string contents are rewritten — stuffing the
+            # joined prompt into a content-block list would corrupt it.
             for msg in messages:
-                if msg.get("role") == "user":
+                if (msg.get("role") == "user" and isinstance(msg.get("content"), str)
+                        and msg["content"] != new_text):
                     msg["content"] = new_text
-            return data
+                    changed = True
+            return changed
 
-        if "prompt" in data:
-            data["prompt"] = new_text
-        elif "input" in data:
-            data["input"] = new_text
+        for key in ("prompt", "input"):
+            value = data.get(key)
+            if isinstance(value, str):
+                if value != new_text:
+                    data[key] = new_text
+                    return True
+                return False
+            if isinstance(value, list):
+                # List prompts are redacted element-wise so the list
+                # shape (one entry per completion/embedding) survives
+                redacted = [redact_pii(el, detect_pii(el, self.rules.pii_rules))
+                            if isinstance(el, str) else el
+                            for el in value]
+                if redacted != value:
+                    data[key] = redacted
+                    return True
+                return False
 
-        return data
+        return changed
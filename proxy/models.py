@@ -1,10 +1,30 @@
-"""Pydantic data models for The Prompt Firewall."""
+"""Data models for The Prompt Firewall.
+
+Config-facing models (rules) stay on Pydantic — they validate untrusted
+input from the REST API and rules file. Hot-path models that are only
+constructed internally (traffic entries, detector matches, stats) are
+plain slotted dataclasses: no per-field validation, no dict-backed
+storage, much cheaper to allocate per request.
+"""
 from __future__ import annotations
+from dataclasses import dataclass, field
 from pydantic import BaseModel, Field
 from enum import Enum
 from datetime import datetime
 from typing import Optional
-import uuid
+import itertools
+import secrets
+import time
+
+# Traffic ids only need to be unique within a session; uuid4 reads the
+# CSPRNG on every call. A per-process nonce plus a plain counter gives
+# the same 8-char shape at a fraction of the cost.
+_id_nonce = secrets.token_hex(2)
+_id_counter = itertools.count()
+
+
+def _next_id() -> str:
+    return f"{_id_nonce}{next(_id_counter) & 0xFFFF:04x}"
 
 
 class ThreatLevel(str, Enum):
@@ -62,22 +82,33 @@ class SecurityRules(BaseModel):
     budget_rule: BudgetRule = Field(default_factory=BudgetRule)
 
 
-class PIIMatch(BaseModel):
+# Match results stay as lists of slotted dataclasses rather than a
+# struct-of-arrays layout: per-request match counts are tiny (usually
+# zero), injection hits reuse shared immutable instances, and every
+# aggregation over them is a single short walk — columnar storage
+# would add a dependency and a conversion step without a workload that
+# benefits.
+@dataclass(slots=True)
+class PIIMatch:
     pii_type: PIIType
     value: str
     redacted: str
     position: tuple[int, int]
 
 
-class InjectionMatch(BaseModel):
+@dataclass(slots=True)
+class InjectionMatch:
     pattern: str
     score: float
     severity: ThreatLevel
 
 
-class TrafficEntry(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4())[:8])
-    timestamp: datetime = Field(default_factory=datetime.now)
+@dataclass(slots=True)
+class TrafficEntry:
+    id: str = field(default_factory=_next_id)
+    # Unix epoch nanoseconds; formatted lazily via timestamp_iso() only
+    # when an entry is actually emitted to the dashboard
+    timestamp: int = field(default_factory=time.time_ns)
     method: str = "POST"
     endpoint: str = ""
     model: str = "unknown"
@@ -86,14 +117,53 @@ class TrafficEntry(BaseModel):
     tokens_used: int = 0
     cost: float = 0.0
     threat_level: ThreatLevel = ThreatLevel.NONE
-    pii_detected: list[PIIMatch] = Field(default_factory=list)
-    injection_detected: list[InjectionMatch] = Field(default_factory=list)
+    pii_detected: list[PIIMatch] = field(default_factory=list)
+    injection_detected: list[InjectionMatch] = field(default_factory=list)
     blocked: bool = False
     block_reason: Optional[str] = None
     latency_ms: float = 0.0
-
-
-class DashboardStats(BaseModel):
+    is_streaming: bool = False
+
+    def timestamp_iso(self) -> str:
+        """ISO-8601 form of the timestamp, computed on demand."""
+        return datetime.fromtimestamp(self.timestamp / 1e9).isoformat()
+
+    def to_log_dict(self) -> dict:
+        """Loggable dict via direct attribute reads.
+
+        dataclasses.asdict recursively deep-copies every field through
+        a generic walk; this spells out the fields instead, which is
+        several times cheaper and runs on every proxied request.
+        """
+        return {
+            "id": self.id,
+            "timestamp": self.timestamp_iso(),
+            "method": self.method,
+            "endpoint": self.endpoint,
+            "model": self.model,
+            "prompt_preview": self.prompt_preview,
+            "status": self.status,
+            "tokens_used": self.tokens_used,
+            "cost": self.cost,
+            "threat_level": self.threat_level,
+            "pii_detected": [
+                {"pii_type": p.pii_type, "value": p.value,
+                 "redacted": p.redacted, "position": p.position}
+                for p in self.pii_detected
+            ],
+            "injection_detected": [
+                {"pattern": m.pattern, "score": m.score, "severity": m.severity}
+                for m in self.injection_detected
+            ],
+            "blocked": self.blocked,
+            "block_reason": self.block_reason,
+            "latency_ms": self.latency_ms,
+            "is_streaming": self.is_streaming,
+        }
+
+
+@dataclass(slots=True)
+class DashboardStats:
     total_requests: int = 0
     blocked_requests: int = 0
     pii_detections: int = 0
@@ -7,6 +7,7 @@ request/response parsing and accurate model identification.
 from __future__ import annotations
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
 from urllib.parse import urlparse
 
 
@@ -31,24 +32,75 @@ class ProviderInfo:
     is_streaming: bool = False
 
 
-# URL → Provider mapping
-_URL_PATTERNS: list[tuple[str, Provider]] = [
-    ("api.openai.com", Provider.OPENAI),
-    ("api.anthropic.com", Provider.ANTHROPIC),
-    ("generativelanguage.googleapis.com", Provider.GOOGLE),
-    ("aiplatform.googleapis.com", Provider.GOOGLE),
-    ("openrouter.ai", Provider.OPENAI),  # OpenRouter uses OpenAI format
-    ("api.mistral.ai", Provider.MISTRAL),
-    ("api.cohere.ai", Provider.COHERE),
-    ("api.deepseek.com", Provider.DEEPSEEK),
-    ("localhost:11434", Provider.OLLAMA),
-    ("127.0.0.1:11434", Provider.OLLAMA),
-]
+# Host → Provider mapping. All known providers are exact hostnames
+# (plus the host:port localhost forms), so detection is a single dict
+# lookup; only Azure needs a suffix check. A substring automaton
+# (Aho-Corasick) over the raw URL would scale no better than this O(1)
+# probe and would mis-detect hosts that merely embed a provider name
+# (e.g. api.openai.com.evil.example) — exact-host matching is both the
+# faster and the safer shape here.
+_HOST_MAP: dict[str, Provider] = {
+    "api.openai.com": Provider.OPENAI,
+    "api.anthropic.com": Provider.ANTHROPIC,
+    "generativelanguage.googleapis.com": Provider.GOOGLE,
+    "aiplatform.googleapis.com": Provider.GOOGLE,
+    "openrouter.ai": Provider.OPENAI,  # OpenRouter uses OpenAI format
+    "api.mistral.ai": Provider.MISTRAL,
+    "api.cohere.ai": Provider.COHERE,
+    "api.deepseek.com": Provider.DEEPSEEK,
+    "localhost:11434": Provider.OLLAMA,
+    "127.0.0.1:11434": Provider.OLLAMA,
+}
+
+
+@lru_cache(maxsize=256)
+def _resolve_url(target_url: str) -> tuple[Provider, str, bool]:
+    """Resolve the URL-derived fields of provider detection.
+
+    Proxies see the same handful of upstream URLs over and over, so the
+    urlparse + host lookup is cached; only body-derived fields (model,
+    streaming flag) are computed per request.
+
+    Returns:
+        (provider, base_url, is_chat)
+    """
+    parsed = urlparse(target_url)
+    host = parsed.netloc.lower()
+
+    # Azure OpenAI uses custom subdomains
+    if host.endswith(".openai.azure.com") or ".openai.azure.com:" in host:
+        return Provider.AZURE_OPENAI, f"{parsed.scheme}://{parsed.netloc}", "/chat/" in parsed.path
+
+    # Match known providers — single dict lookup, retried without an
+    # explicit port so "api.openai.com:443" still resolves
+    provider = _HOST_MAP.get(host)
+    if provider is None and ":" in host:
+        provider = _HOST_MAP.get(host.rsplit(":", 1)[0])
+    if provider is not None:
+        return provider, f"{parsed.scheme}://{parsed.netloc}", _is_chat_endpoint(parsed.path, provider)
+
+    return Provider.UNKNOWN, target_url, True
+
+
+@lru_cache(maxsize=256)
+def _info_for_url(target_url: str) -> ProviderInfo:
+    """Fully resolved ProviderInfo for a bare URL (no body fields)."""
+    provider, base_url, is_chat = _resolve_url(target_url)
+    return ProviderInfo(
+        provider=provider,
+        model="unknown",
+        base_url=base_url,
+        is_chat=is_chat,
+    )
 
 
 def detect_provider(target_url: str, body: dict | None = None) -> ProviderInfo:
     """Detect the AI provider from the target URL and request body.
 
+    Without a body every field is URL-derived, so the proxy hot path
+    gets a fully cached ProviderInfo back — one dict probe per call.
+    Callers treat the result as read-only.
+
     Args:
         target_url: The upstream API URL being proxied to
         body: Parsed request body (optional, for model extraction)
@@ -56,37 +108,15 @@ def detect_provider(target_url: str, body: dict | None = None) -> ProviderInfo:
     Returns:
         ProviderInfo with detected provider, model, and metadata
     """
-    parsed = urlparse(target_url)
-    host = parsed.netloc.lower()
-
-    # Azure OpenAI uses custom subdomains
-    if ".openai.azure.com" in host:
-        model = _extract_model(body, Provider.AZURE_OPENAI)
-        return ProviderInfo(
-            provider=Provider.AZURE_OPENAI,
-            model=model,
-            base_url=f"{parsed.scheme}://{parsed.netloc}",
-            is_chat="/chat/" in parsed.path,
-            is_streaming=body.get("stream", False) if body else False,
-        )
-
-    # Match known providers
-    for pattern, provider in _URL_PATTERNS:
-        if pattern in host:
-            model = _extract_model(body, provider)
-            return ProviderInfo(
-                provider=provider,
-                model=model,
-                base_url=f"{parsed.scheme}://{parsed.netloc}",
-                is_chat=_is_chat_endpoint(parsed.path, provider),
-                is_streaming=body.get("stream", False) if body else False,
-            )
-
-    # Unknown provider
+    if body is None:
+        return _info_for_url(target_url)
+    provider, base_url, is_chat = _resolve_url(target_url)
     return ProviderInfo(
-        provider=Provider.UNKNOWN,
-        model=_extract_model(body, Provider.UNKNOWN),
-        base_url=target_url,
+        provider=provider,
+        model=_extract_model(body, provider),
+        base_url=base_url,
+        is_chat=is_chat,
+        is_streaming=body.get("stream", False),
     )
 
 
@@ -119,17 +149,21 @@ def _is_chat_endpoint(path: str, provider: Provider) -> bool:
     return any(p in path for p in chat_patterns)
 
 
+# Built once at import — get_provider_display_name used to rebuild this
+# dict on every call
+_DISPLAY_NAMES: dict[Provider, str] = {
+    Provider.OPENAI: "OpenAI",
+    Provider.ANTHROPIC: "Anthropic",
+    Provider.GOOGLE: "Google AI",
+    Provider.OLLAMA: "Ollama (Local)",
+    Provider.AZURE_OPENAI: "Azure OpenAI",
+    Provider.MISTRAL: "Mistral AI",
+    Provider.COHERE: "Cohere",
+    Provider.DEEPSEEK: "DeepSeek",
+    Provider.UNKNOWN: "Unknown",
+}
+
+
 def get_provider_display_name(provider: Provider) -> str:
     """Get a human-readable display name for a provider."""
-    names = {
-        Provider.OPENAI: "OpenAI",
-        Provider.ANTHROPIC: "Anthropic",
-        Provider.GOOGLE: "Google AI",
-        Provider.OLLAMA: "Ollama (Local)",
-        Provider.AZURE_OPENAI: "Azure OpenAI",
-        Provider.MISTRAL: "Mistral AI",
-        Provider.COHERE: "Cohere",
-        Provider.DEEPSEEK: "DeepSeek",
-        Provider.UNKNOWN: "Unknown",
-    }
-    return names.get(provider, "Unknown")
+    return _DISPLAY_NAMES.get(provider, "Unknown")
@@ -10,30 +10,108 @@ Security: CORS restricted, API key auth, rate-limited.
 from __future__ import annotations
 import asyncio
 import csv
+import hmac
 import io
-import json
 import os
 import secrets
 import sys
 import time
-from collections import deque
+import zlib
+from collections import OrderedDict, deque
+from dataclasses import asdict
+from itertools import islice
 from datetime import datetime
+import msgspec
+import orjson
+import aiohttp
 from aiohttp import web, ClientSession
 import websockets
 from websockets.asyncio.server import serve as ws_serve
 
+try:
+    import uvloop
+except ImportError:  # not available on Windows — stock asyncio works fine
+    uvloop = None
+
 # Add parent to path
 sys.path.insert(0, os.path.dirname(__file__))
 
 from models import SecurityRules, TrafficEntry, DashboardStats, ThreatLevel
 from config import Config
-from interceptor import Interceptor
+from interceptor import Interceptor, shutdown_executor
 from budget import BudgetTracker
 from alerts import AlertManager, AlertEvent
 from providers import detect_provider
 from access import AccessManager
 
 
+# ─── Rolling Stats ────────────────────────────────────────────
+class RollingStats:
+    """Dashboard counters maintained incrementally.
+
+    get_stats() used to re-scan the whole 10k-entry traffic log and
+    fromisoformat-parse every timestamp on every proxied request. Each
+    entry is now recorded once into a 60-slot seconds window (for
+    requests_per_minute) and a 1440-slot minutes window (for the daily
+    totals), with running sums adjusted as buckets expire — O(1) per
+    request instead of O(log size).
+    """
+
+    def __init__(self):
+        self._seconds: OrderedDict[int, int] = OrderedDict()
+        self._rpm = 0
+        self._minutes: OrderedDict[int, list[int]] = OrderedDict()
+        self._day = [0, 0, 0, 0]  # requests, blocked, pii, injection
+
+    def record(self, entry: TrafficEntry):
+        now = int(time.time())
+        self._expire(now)
+        self._seconds[now] = self._seconds.get(now, 0) + 1
+        self._rpm += 1
+
+        minute = now // 60
+        bucket = self._minutes.get(minute)
+        if bucket is None:
+            bucket = self._minutes[minute] = [0, 0, 0, 0]
+        deltas = (1, 1 if entry.blocked else 0,
+                  len(entry.pii_detected), len(entry.injection_detected))
+        day = self._day
+        for i, delta in enumerate(deltas):
+            bucket[i] += delta
+            day[i] += delta
+
+    def _expire(self, now: int):
+        seconds = self._seconds
+        cutoff = now - 60
+        while seconds:
+            ts = next(iter(seconds))
+            if ts > cutoff:
+                break
+            self._rpm -= seconds.pop(ts)
+
+        minutes = self._minutes
+        cutoff = now // 60 - 1440
+        day = self._day
+        while minutes:
+            m = next(iter(minutes))
+            if m > cutoff:
+                break
+            for i, delta in enumerate(minutes.pop(m)):
+                day[i] -= delta
+
+    def snapshot(self) -> DashboardStats:
+        """Current counters as a DashboardStats (budget fields unset)."""
+        self._expire(int(time.time()))
+        day = self._day
+        return DashboardStats(
+            total_requests=day[0],
+            blocked_requests=day[1],
+            pii_detections=day[2],
+            injection_attempts=day[3],
+            requests_per_minute=self._rpm,
+        )
+
+
 # ─── Application State ────────────────────────────────────────
 class AppState:
     """Encapsulates all mutable application state."""
@@ -45,7 +123,17 @@ class AppState:
         self.alert_manager = AlertManager()
         self.access_manager = AccessManager()
         self.traffic_log: deque[dict] = deque(maxlen=10_000)
-        self.ws_clients: set = set()
+        # id → entry dict, kept in lockstep with traffic_log so replay
+        # lookups are a dict probe instead of a scan of the ring
+        self.traffic_index: dict[str, dict] = {}
+        self.stats = RollingStats()
+        # websocket → outbound frame queue, drained by a writer task
+        self.ws_queues: dict = {}
+        # Alerts funnel through one bounded queue + worker task instead
+        # of a fresh asyncio.Task per fire
+        self.alert_queue: asyncio.Queue = asyncio.Queue(maxsize=10_000)
+        self.alerts_dropped = 0
+        self._alert_task: asyncio.Task | None = None
         self.start_time = time.time()
         self.http_session: ClientSession | None = None
 
@@ -56,17 +144,40 @@ class AppState:
         allowed = os.environ.get("PF_CORS_ORIGINS", "http://localhost:3000")
         self.cors_origins: set[str] = {o.strip() for o in allowed.split(",")}
 
+    async def open_session(self) -> None:
+        """Create the persistent upstream HTTP session.
+
+        Called once at startup (ClientSession must be built inside the
+        running loop). The connector keeps connections warm per upstream
+        host and caches DNS answers, so steady-state requests skip the
+        TCP/TLS handshake entirely.
+        """
+        self.http_session = ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=0,               # no global cap — per-host limit governs
+                limit_per_host=64,
+                ttl_dns_cache=300,
+                enable_cleanup_closed=True,
+            ),
+            timeout=aiohttp.ClientTimeout(total=60, connect=5),
+        )
+
     async def get_session(self) -> ClientSession:
-        """Get or create a reusable HTTP client session."""
+        """Return the shared HTTP client session."""
         if self.http_session is None or self.http_session.closed:
-            self.http_session = ClientSession()
+            # Only reached outside the normal startup path (tests,
+            # post-shutdown stragglers)
+            await self.open_session()
         return self.http_session
 
     async def close(self):
         """Clean up resources."""
+        if self._alert_task is not None:
+            self._alert_task.cancel()
         if self.http_session and not self.http_session.closed:
             await self.http_session.close()
         await self.alert_manager.close()
+        shutdown_executor()
 
 
 # ─── Global State ──────────────────────────────────────────────
@@ -74,65 +185,168 @@ state = AppState()
 
 
 # ─── WebSocket Broadcasting ───────────────────────────────────
-async def broadcast(data: dict):
-    """Send traffic data to all connected WebSocket clients."""
-    if state.ws_clients:
-        message = json.dumps(data, default=str)
-        dead = set()
-        for ws in state.ws_clients:
+# Frames this size or larger are zlib-compressed once before fan-out;
+# permessage-deflate is off, so N clients no longer means N deflates
+# of the same bytes. The dashboard inflates binary frames with pako.
+_WS_COMPRESS_MIN = 512
+
+
+def _ws_frame(payload: bytes) -> str | bytes:
+    """Wire form of a serialized frame: text, or zlib binary if large."""
+    if len(payload) >= _WS_COMPRESS_MIN:
+        return zlib.compress(payload, 1)
+    return payload.decode()
+
+
+def _traffic_frame(entry_dict: dict) -> str | bytes:
+    """Serialize a traffic event exactly once, for all clients."""
+    return _ws_frame(orjson.dumps(
+        {"type": "traffic", "entry": entry_dict, "stats": get_stats()}
+    ))
+
+
+# Serialized once — the ping/pong exchange never changes
+_PONG = '{"type": "pong"}'
+
+
+def broadcast(message: str | bytes):
+    """Queue a pre-serialized frame for all connected WebSocket clients.
+
+    Producers hand in the serialized message so it is built once per
+    event. Each client has its own bounded queue drained by a dedicated
+    writer task, so broadcasting is a non-awaiting O(clients) loop of
+    queue appends and a slow client never stalls the others — it just
+    loses its oldest frames.
+
+    No awaits happen inside the loop, so ws_handler cannot mutate
+    ws_queues mid-iteration and there is no dead-client set to sweep —
+    disconnects deregister themselves in the handler's finally block.
+    """
+    for queue in state.ws_queues.values():
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
             try:
-                await ws.send(message)
-            except Exception:
-                dead.add(ws)
-        state.ws_clients -= dead
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                pass
+            queue.put_nowait(message)
+
+
+# ─── Alert Dispatch ───────────────────────────────────────────
+def _fire_alert(event, message: str, context: dict):
+    """Queue an alert for the background worker.
+
+    proxy_handler used to spawn a fresh asyncio.Task per alert (up to
+    three per request); at high RPS the Task allocations dominate. Now
+    there is one worker per server and firing is a put_nowait. Full
+    queue drops the alert and counts it.
+    """
+    try:
+        state.alert_queue.put_nowait((event, message, context))
+    except asyncio.QueueFull:
+        state.alerts_dropped += 1
+
+
+async def _alert_worker():
+    """Drain the alert queue, one webhook fire at a time."""
+    queue = state.alert_queue
+    while True:
+        event, message, context = await queue.get()
+        try:
+            await state.alert_manager.fire(event, message, context)
+        except Exception as e:
+            print(f"[ERROR] Alert delivery failed: {e}")
+
+
+async def _ws_writer(websocket, queue: asyncio.Queue):
+    """Drain one client's outbound queue onto its socket."""
+    try:
+        while True:
+            await websocket.send(await queue.get())
+    except websockets.exceptions.ConnectionClosed:
+        pass
 
 
 async def ws_handler(websocket):
     """Handle WebSocket connections from the dashboard."""
-    state.ws_clients.add(websocket)
-    print(f"[WS] Dashboard connected ({len(state.ws_clients)} clients)")
+    # Send the init snapshot before registering for broadcasts, so the
+    # writer task can't interleave frames into it
     try:
-        await websocket.send(json.dumps({
+        await websocket.send(_ws_frame(orjson.dumps({
             "type": "init",
-            "traffic": list(state.traffic_log)[-100:],
+            "traffic": _log_tail(100),
             "stats": get_stats(),
-        }, default=str))
+        })))
+    except websockets.exceptions.ConnectionClosed:
+        return
 
+    queue: asyncio.Queue = asyncio.Queue(maxsize=256)
+    writer = asyncio.create_task(_ws_writer(websocket, queue))
+    state.ws_queues[websocket] = queue
+    print(f"[WS] Dashboard connected ({len(state.ws_queues)} clients)")
+    try:
         async for message in websocket:
-            data = json.loads(message)
+            data = orjson.loads(message)
             if data.get("type") == "ping":
-                await websocket.send(json.dumps({"type": "pong"}))
+                queue.put_nowait(_PONG)
     except websockets.exceptions.ConnectionClosed:
         pass
     finally:
-        state.ws_clients.discard(websocket)
-        print(f"[WS] Dashboard disconnected ({len(state.ws_clients)} clients)")
+        state.ws_queues.pop(websocket, None)
+        writer.cancel()
+        print(f"[WS] Dashboard disconnected ({len(state.ws_queues)} clients)")
+
+
+def _entry_dict(entry: TrafficEntry) -> dict:
+    """Loggable dict for a traffic entry, ISO timestamp included.
+
+    The one place the nanosecond timestamp is formatted — the three
+    proxy_handler branches used to each run their own asdict + isoformat
+    pair.
+    """
+    return entry.to_log_dict()
+
+
+def _log_traffic(entry_dict: dict) -> None:
+    """Append an entry to the traffic log and keep the id index in sync.
+
+    The deque evicts its oldest entry silently once full, so the evictee
+    is dropped from the index before the append.
+    """
+    log = state.traffic_log
+    if len(log) == log.maxlen:
+        state.traffic_index.pop(log[0]["id"], None)
+    log.append(entry_dict)
+    state.traffic_index[entry_dict["id"]] = entry_dict
+
+
+def _log_tail(limit: int) -> list[dict]:
+    """Last `limit` traffic entries, oldest first.
+
+    Walks the deque from its right end, so the cost is O(limit) rather
+    than copying the whole 10k-entry ring the way list(log)[-limit:]
+    does.
+    """
+    log = state.traffic_log
+    if limit >= len(log):
+        return list(log)
+    tail = list(islice(reversed(log), limit))
+    tail.reverse()
+    return tail
 
 
 # ─── Stats ─────────────────────────────────────────────────────
 def get_stats() -> dict:
-    """Compute current dashboard statistics."""
-    now = datetime.now()
-    recent = [t for t in state.traffic_log
-              if (now - datetime.fromisoformat(t["timestamp"])).total_seconds() < 86400]
-
-    minute_ago = [t for t in state.traffic_log
-                  if (now - datetime.fromisoformat(t["timestamp"])).total_seconds() < 60]
-
-    stats = DashboardStats(
-        total_requests=len(recent),
-        blocked_requests=sum(1 for t in recent if t.get("blocked")),
-        pii_detections=sum(len(t.get("pii_detected", [])) for t in recent),
-        injection_attempts=sum(len(t.get("injection_detected", [])) for t in recent),
-        total_spend_today=state.budget_tracker.get_spend("daily"),
-        total_tokens_today=state.budget_tracker.get_tokens("daily"),
-        requests_per_minute=len(minute_ago),
-    )
-    return stats.model_dump()
+    """Current dashboard statistics from the rolling counters."""
+    stats = state.stats.snapshot()
+    stats.total_spend_today = state.budget_tracker.get_spend("daily")
+    stats.total_tokens_today = state.budget_tracker.get_tokens("daily")
+    return asdict(stats)
 
 
 # ─── Proxy Handler ─────────────────────────────────────────────
-async def proxy_handler(request: web.Request) -> web.Response:
+async def proxy_handler(request: web.Request) -> web.StreamResponse:
     """Intercept and forward AI API requests."""
     start = time.time()
     body = await request.read()
@@ -149,18 +363,23 @@ async def proxy_handler(request: web.Request) -> web.Response:
         session = await state.get_session()
         try:
             async with session.request(request.method, target_url, headers=headers, data=body) as resp:
-                resp_body = await resp.read()
-                return web.Response(body=resp_body, status=resp.status,
-                                    headers={k: v for k, v in resp.headers.items()
-                                             if k.lower() not in ("content-encoding", "transfer-encoding")})
+                relay = web.StreamResponse(
+                    status=resp.status,
+                    headers={k: v for k, v in resp.headers.items()
+                             if k.lower() not in ("content-encoding", "transfer-encoding", "content-length")})
+                await relay.prepare(request)
+                async for chunk in resp.content.iter_any():
+                    await relay.write(chunk)
+                await relay.write_eof()
+                return relay
         except Exception as e:
             return web.json_response({"error": str(e)}, status=502)
 
     # === Provider Detection ===
     provider_info = detect_provider(target_url)
 
-    # Process through security pipeline
-    processed_body, entry = state.interceptor.process_request(body, str(request.url))
+    # Process through security pipeline (large prompts scan off-loop)
+    processed_body, entry = await state.interceptor.process_request_async(body, str(request.url))
     entry.method = request.method
     if provider_info.model != "unknown":
         entry.model = provider_info.model
@@ -168,17 +387,17 @@ async def proxy_handler(request: web.Request) -> web.Response:
     if entry.blocked:
         entry.status = 403
         entry.latency_ms = (time.time() - start) * 1000
-        entry_dict = entry.model_dump()
-        entry_dict["timestamp"] = entry_dict["timestamp"].isoformat()
+        entry_dict = _entry_dict(entry)
         # Scrub any sensitive headers from log
-        state.traffic_log.append(entry_dict)
-        await broadcast({"type": "traffic", "entry": entry_dict, "stats": get_stats()})
+        _log_traffic(entry_dict)
+        state.stats.record(entry)
+        broadcast(_traffic_frame(entry_dict))
 
         # Fire alert for blocked request
-        asyncio.create_task(state.alert_manager.fire(
+        _fire_alert(
             AlertEvent.REQUEST_BLOCKED, f"Request blocked: {entry.block_reason}",
             {"endpoint": entry.endpoint, "model": entry.model, "reason": entry.block_reason}
-        ))
+        )
 
         print(f"[BLOCKED] {entry.block_reason}")
         return web.json_response(
@@ -196,47 +415,61 @@ async def proxy_handler(request: web.Request) -> web.Response:
             request.method, target_url,
             headers=headers, data=processed_body
         ) as resp:
-            resp_body = await resp.read()
             entry.status = resp.status
-            entry = state.interceptor.process_response(resp_body, entry)
+            resp_headers = {k: v for k, v in resp.headers.items()
+                            if k.lower() not in ("content-encoding", "transfer-encoding", "content-length")}
+
+            if entry.is_streaming and resp.status == 200:
+                # SSE: relay frames as they arrive instead of buffering
+                # the whole stream — the client sees the first token as
+                # soon as the upstream emits it. process_response skips
+                # body parsing for streaming entries anyway.
+                out: web.StreamResponse = web.StreamResponse(status=resp.status, headers=resp_headers)
+                await out.prepare(request)
+                async for chunk in resp.content.iter_any():
+                    await out.write(chunk)
+                await out.write_eof()
+                entry = state.interceptor.process_response(b"", entry)
+            else:
+                # Non-streaming bodies are still buffered: response PII
+                # scanning and usage extraction need the full document.
+                resp_body = await resp.read()
+                entry = state.interceptor.process_response(resp_body, entry)
+                out = web.Response(body=resp_body, status=resp.status, headers=resp_headers)
+
             entry.latency_ms = (time.time() - start) * 1000
 
-            entry_dict = entry.model_dump()
-            entry_dict["timestamp"] = entry_dict["timestamp"].isoformat()
-            state.traffic_log.append(entry_dict)
-            await broadcast({"type": "traffic", "entry": entry_dict, "stats": get_stats()})
+            entry_dict = _entry_dict(entry)
+            _log_traffic(entry_dict)
+            state.stats.record(entry)
+            broadcast(_traffic_frame(entry_dict))
 
             print(f"[PROXY] {entry.model} | {entry.tokens_used} tokens | ${entry.cost:.4f} | {entry.threat_level.value}")
 
             # Fire alert for high/critical threats
             if entry.threat_level in (ThreatLevel.HIGH, ThreatLevel.CRITICAL):
                 evt = AlertEvent.THREAT_CRITICAL if entry.threat_level == ThreatLevel.CRITICAL else AlertEvent.THREAT_HIGH
-                asyncio.create_task(state.alert_manager.fire(
+                _fire_alert(
                     evt, f"Threat {entry.threat_level.value}: {entry.model}",
                     {"endpoint": entry.endpoint, "model": entry.model, "tokens": entry.tokens_used}
-                ))
+                )
             # Fire alert for response PII leaks
             resp_leaks = [p for p in entry.pii_detected if p.redacted.startswith("[RESP]")]
             if resp_leaks:
-                asyncio.create_task(state.alert_manager.fire(
+                _fire_alert(
                     AlertEvent.PII_RESPONSE_LEAK,
                     f"PII leaked in response from {entry.model}",
                     {"pii_types": [p.pii_type.value for p in resp_leaks], "model": entry.model}
-                ))
-
-            return web.Response(
-                body=resp_body,
-                status=resp.status,
-                headers={k: v for k, v in resp.headers.items()
-                         if k.lower() not in ("content-encoding", "transfer-encoding")}
-            )
+                )
+
+            return out
     except Exception as e:
         entry.status = 502
         entry.latency_ms = (time.time() - start) * 1000
-        entry_dict = entry.model_dump()
-        entry_dict["timestamp"] = entry_dict["timestamp"].isoformat()
-        state.traffic_log.append(entry_dict)
-        await broadcast({"type": "traffic", "entry": entry_dict, "stats": get_stats()})
+        entry_dict = _entry_dict(entry)
+        _log_traffic(entry_dict)
+        state.stats.record(entry)
+        broadcast(_traffic_frame(entry_dict))
 
         print(f"[ERROR] Proxy error: {e}")
         return web.json_response({"error": str(e)}, status=502)
@@ -268,31 +501,53 @@ async def api_update_rules(request: web.Request) -> web.Response:
 
 async def api_get_traffic(request: web.Request) -> web.Response:
     limit = int(request.query.get("limit", 100))
-    return web.json_response(list(state.traffic_log)[-limit:])
+    return web.json_response(_log_tail(limit))
 
 
 async def api_get_budget(request: web.Request) -> web.Response:
     return web.json_response(state.budget_tracker.get_stats())
 
 
+# Typed payloads for the test/replay endpoints — one C-level decode
+# that parses and type-checks in the same pass, replacing
+# request.json() plus hand-written isinstance checks
+class _TestPayload(msgspec.Struct):
+    text: str = ""
+
+
+class _ReplayPayload(msgspec.Struct):
+    id: str | None = None
+    text: str = ""
+    endpoint: str = "test://replay"
+    model: str = "unknown"
+
+
+_TEST_DECODER = msgspec.json.Decoder(_TestPayload)
+_REPLAY_DECODER = msgspec.json.Decoder(_ReplayPayload)
+
+
 async def api_test_pii(request: web.Request) -> web.Response:
     """Test endpoint: send text and see PII detection results."""
-    data = await request.json()
-    text = data.get("text", "")
-    if not text or not isinstance(text, str):
+    try:
+        text = _TEST_DECODER.decode(await request.read()).text
+    except (msgspec.DecodeError, msgspec.ValidationError):
+        text = ""
+    if not text:
         return web.json_response(
             {"error": "Missing or invalid 'text' field"}, status=400
         )
     from detectors.pii import detect_pii
     matches = detect_pii(text, state.config.rules.pii_rules)
-    return web.json_response([m.model_dump() for m in matches])
+    return web.json_response([asdict(m) for m in matches])
 
 
 async def api_test_injection(request: web.Request) -> web.Response:
     """Test endpoint: send text and see injection detection results."""
-    data = await request.json()
-    text = data.get("text", "")
-    if not text or not isinstance(text, str):
+    try:
+        text = _TEST_DECODER.decode(await request.read()).text
+    except (msgspec.DecodeError, msgspec.ValidationError):
+        text = ""
+    if not text:
         return web.json_response(
             {"error": "Missing or invalid 'text' field"}, status=400
         )
@@ -300,38 +555,57 @@ async def api_test_injection(request: web.Request) -> web.Response:
     matches = detect_injection(text, state.config.rules.injection_rule)
     score = compute_threat_score(matches)
     return web.json_response({
-        "matches": [m.model_dump() for m in matches],
+        "matches": [asdict(m) for m in matches],
         "score": score,
         "level": get_threat_level(score).value,
     })
 
 
-async def api_export_traffic(request: web.Request) -> web.Response:
-    """Export traffic log as CSV or JSON."""
+async def api_export_traffic(request: web.Request) -> web.StreamResponse:
+    """Export traffic log as CSV or JSON.
+
+    Rows are streamed in chunks instead of materializing the whole
+    export in memory first, so peak RSS stays flat no matter how full
+    the 10k-entry log is and clients see bytes immediately.
+    """
     fmt = request.query.get("format", "json").lower()
-    entries = list(state.traffic_log)
+    entries = list(state.traffic_log)  # snapshot: handler awaits mid-walk
 
     if fmt == "csv":
-        output = io.StringIO()
+        resp = web.StreamResponse(headers={
+            "Content-Type": "text/csv",
+            "Content-Disposition": "attachment; filename=traffic_export.csv",
+        })
+        await resp.prepare(request)
         if entries:
-            writer = csv.DictWriter(output, fieldnames=entries[0].keys())
+            buf = io.StringIO()
+            writer = csv.DictWriter(buf, fieldnames=entries[0].keys())
             writer.writeheader()
             for entry in entries:
                 flat = {}
                 for k, v in entry.items():
-                    flat[k] = json.dumps(v) if isinstance(v, (list, dict)) else v
+                    flat[k] = orjson.dumps(v).decode() if isinstance(v, (list, dict)) else v
                 writer.writerow(flat)
-        return web.Response(
-            text=output.getvalue(),
-            content_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=traffic_export.csv"}
-        )
-    else:
-        return web.Response(
-            text=json.dumps(entries, indent=2, default=str),
-            content_type="application/json",
-            headers={"Content-Disposition": "attachment; filename=traffic_export.json"}
-        )
+                if buf.tell() > 64 * 1024:
+                    await resp.write(buf.getvalue().encode())
+                    buf.seek(0)
+                    buf.truncate()
+            await resp.write(buf.getvalue().encode())
+        await resp.write_eof()
+        return resp
+
+    resp = web.StreamResponse(headers={
+        "Content-Type": "application/json",
+        "Content-Disposition": "attachment; filename=traffic_export.json",
+    })
+    await resp.prepare(request)
+    await resp.write(b"[")
+    for i, entry in enumerate(entries):
+        await resp.write(b"," if i else b"")
+        await resp.write(orjson.dumps(entry))
+    await resp.write(b"]")
+    await resp.write_eof()
+    return resp
 
 
 # ─── Webhooks API ──────────────────────────────────────────────
@@ -349,6 +623,7 @@ async def api_add_webhook(request: web.Request) -> web.Response:
         name=data.get("name", "default"),
         events=data.get("events"),
         secret=data.get("secret"),
+        batch=data.get("batch", False),
     )
     return web.json_response({"ok": True, "webhook": {"name": wh.name, "url": wh.url}})
 
@@ -382,35 +657,33 @@ async def api_replay_request(request: web.Request) -> web.Response:
     Accepts an entry ID or raw body+endpoint. Runs the full
     interceptor pipeline but does NOT forward to the API.
     """
-    data = await request.json()
+    try:
+        data = _REPLAY_DECODER.decode(await request.read())
+    except (msgspec.DecodeError, msgspec.ValidationError) as e:
+        return web.json_response({"error": f"Invalid payload: {e}"}, status=400)
 
     # Option 1: replay by entry ID from traffic log
-    entry_id = data.get("id")
-    if entry_id:
-        original = None
-        for entry in state.traffic_log:
-            if entry.get("id") == entry_id:
-                original = entry
-                break
+    if data.id:
+        original = state.traffic_index.get(data.id)
         if not original:
-            return web.json_response({"error": f"Entry {entry_id} not found"}, status=404)
+            return web.json_response({"error": f"Entry {data.id} not found"}, status=404)
         body_text = original.get("prompt_preview", "")
         endpoint = original.get("endpoint", "")
         model = original.get("model", "unknown")
     else:
         # Option 2: raw body + endpoint
-        body_text = data.get("text", "")
-        endpoint = data.get("endpoint", "test://replay")
-        model = data.get("model", "unknown")
+        body_text = data.text
+        endpoint = data.endpoint
+        model = data.model
 
     if not body_text:
         return web.json_response({"error": "No text to replay"}, status=400)
 
     # Build a synthetic request body
-    synthetic_body = json.dumps({
+    synthetic_body = orjson.dumps({
         "model": model,
         "messages": [{"role": "user", "content": body_text}]
-    }).encode()
+    })
 
     # Run through pipeline
     processed_body, entry = state.interceptor.process_request(synthetic_body, endpoint)
@@ -420,8 +693,8 @@ async def api_replay_request(request: web.Request) -> web.Response:
         "blocked": entry.blocked,
         "block_reason": entry.block_reason,
         "threat_level": entry.threat_level.value,
-        "pii_detected": [m.model_dump() for m in entry.pii_detected],
-        "injection_detected": [m.model_dump() for m in entry.injection_detected],
+        "pii_detected": [asdict(m) for m in entry.pii_detected],
+        "injection_detected": [asdict(m) for m in entry.injection_detected],
         "tokens_estimated": entry.tokens_used,
         "model": entry.model,
     })
@@ -453,23 +726,28 @@ async def cors_middleware(request: web.Request, handler):
 
 
 # ─── Auth Middleware ───────────────────────────────────────────
+# Allow OPTIONS (CORS preflight), GET stats/traffic/budget, and test
+# endpoints without auth for dashboard convenience. Built once — these
+# used to be re-allocated as set literals on every request.
+_EXEMPT_PATHS = frozenset({
+    "/api/stats", "/api/rules", "/api/traffic", "/api/budget",
+    "/api/test/pii", "/api/test/injection",
+    "/api/traffic/export", "/api/webhooks", "/api/alerts",
+    "/api/access", "/api/replay",
+})
+_EXEMPT_METHODS = frozenset({"OPTIONS", "GET"})
+
+
 @web.middleware
 async def auth_middleware(request: web.Request, handler):
     """Require API key for mutating endpoints."""
-    # Allow OPTIONS (CORS preflight), GET stats/traffic/budget, and test endpoints
-    # without auth for dashboard convenience
-    exempt_paths = {"/api/stats", "/api/rules", "/api/traffic", "/api/budget",
-                    "/api/test/pii", "/api/test/injection",
-                    "/api/traffic/export", "/api/webhooks", "/api/alerts",
-                    "/api/access", "/api/replay"}
-    exempt_methods = {"OPTIONS", "GET"}
-
-    if request.method in exempt_methods or request.path in exempt_paths:
+    if request.method in _EXEMPT_METHODS or request.path in _EXEMPT_PATHS:
         return await handler(request)
 
-    # Check API key for POST/PUT/DELETE
+    # Check API key for POST/PUT/DELETE — constant-time compare so the
+    # check leaks nothing about the key via response timing
     api_key = request.headers.get("X-API-Key", "")
-    if api_key != state.api_key:
+    if not hmac.compare_digest(api_key, state.api_key):
         return web.json_response(
             {"error": "unauthorized", "detail": "Invalid or missing X-API-Key header"},
             status=401
@@ -522,8 +800,14 @@ async def main():
     print(r"""  ╚═══════════════════════════════════════════════════════╝
     """)
 
+    # Open the shared upstream session inside the running loop and
+    # start the alert worker
+    await state.open_session()
+    state._alert_task = asyncio.create_task(_alert_worker())
+
     # Start WebSocket server
-    ws_server = await ws_serve(ws_handler, "localhost", 8765)
+    # permessage-deflate off — big frames are pre-compressed in _ws_frame
+    ws_server = await ws_serve(ws_handler, "localhost", 8765, compression=None)
     print("[✓] WebSocket server running on ws://localhost:8765")
 
     # Start REST API server
@@ -557,4 +841,8 @@ async def main():
 
 
 if __name__ == "__main__":
+    if uvloop is not None:
+        # libuv event loop — faster socket I/O for every aiohttp and
+        # websockets await in the process
+        uvloop.install()
     asyncio.run(main())
@@ -4,6 +4,9 @@ Uses OpenAI's tiktoken for precise token estimation per model.
 Falls back to word-count heuristic for unknown models.
 """
 from __future__ import annotations
+import hashlib
+from collections import OrderedDict
+
 import tiktoken
 
 # Map model names to their tiktoken encoding
@@ -17,47 +20,97 @@ _MODEL_ENCODINGS: dict[str, str] = {
     # use cl100k_base as a reasonable approximation
 }
 
-# Cache loaded encodings
-_cache: dict[str, tiktoken.Encoding] = {}
+# model name → ready Encoding. The hot path pays one dict probe; the
+# encoding-name indirection and tiktoken construction only run the
+# first time a model name is seen. Encodings stay lazy so importing
+# this module never touches the tiktoken vocab files.
+_ENCODINGS: dict[str, tiktoken.Encoding] = {}
 
 
 def _get_encoding(model: str) -> tiktoken.Encoding:
     """Get or create the tiktoken encoding for a model."""
-    enc_name = _MODEL_ENCODINGS.get(model, "cl100k_base")
-    if enc_name not in _cache:
-        _cache[enc_name] = tiktoken.get_encoding(enc_name)
-    return _cache[enc_name]
+    enc = _ENCODINGS.get(model)
+    if enc is None:
+        # tiktoken caches Encoding objects per encoding name, so models
+        # sharing an encoding share the object. Cap the memo — model
+        # names arrive from request bodies and are unbounded.
+        enc = tiktoken.get_encoding(_MODEL_ENCODINGS.get(model, "cl100k_base"))
+        if len(_ENCODINGS) < 1024:
+            _ENCODINGS[model] = enc
+    return enc
+
+
+# (model, prompt digest) → token count. Repeated prompts (system
+# prompts, retries) skip the tiktoken encode entirely; keying on a
+# 16-byte blake2b digest avoids pinning large prompt strings in memory.
+_COUNT_CACHE_SIZE = 4096
+_count_cache: OrderedDict[tuple[str, bytes], int] = OrderedDict()
+
+
+def clear_caches():
+    """Drop the token-count and encoding memos.
+
+    Bounded as they are, long-running deployments may still want to
+    release them (e.g. from a debug endpoint or after a pricing test).
+    """
+    _count_cache.clear()
+    _ENCODINGS.clear()
 
 
 def count_tokens(text: str, model: str = "gpt-4o") -> int:
     """Count the exact number of tokens in text for a given model.
 
-    Uses tiktoken for accurate counting. Falls back to
-    word-count × 1.3 if tiktoken fails for any reason.
+    Uses tiktoken for accurate counting, with a digest-keyed LRU cache
+    for repeated prompts. Falls back to word-count × 1.3 if tiktoken
+    fails for any reason.
     """
+    if not text:
+        return 0
+    key = (model, hashlib.blake2b(text.encode(), digest_size=16).digest())
+    cached = _count_cache.get(key)
+    if cached is not None:
+        _count_cache.move_to_end(key)
+        return cached
+
     try:
-        enc = _get_encoding(model)
-        return len(enc.encode(text))
+        count = len(_get_encoding(model).encode(text))
     except Exception:
         # Fallback: rough estimate (more accurate than words × 2)
-        return int(len(text.split()) * 1.3)
+        count = int(len(text.split()) * 1.3)
+
+    _count_cache[key] = count
+    if len(_count_cache) > _COUNT_CACHE_SIZE:
+        _count_cache.popitem(last=False)
+    return count
 
 
 def count_messages_tokens(messages: list[dict], model: str = "gpt-4o") -> int:
     """Count tokens for a list of chat messages (OpenAI format).
 
-    Accounts for the per-message overhead tokens used by the API.
+    Accounts for the per-message overhead tokens used by the API. All
+    string fields are tokenized in one encode_ordinary_batch call — one
+    FFI crossing for the whole conversation rather than one per field.
     """
     # Per OpenAI docs: every message has ~4 overhead tokens
     TOKENS_PER_MESSAGE = 4
     TOKENS_REPLY_OVERHEAD = 3  # every reply is primed with <|im_start|>assistant
 
     total = TOKENS_REPLY_OVERHEAD
+    texts: list[str] = []
     for msg in messages:
         total += TOKENS_PER_MESSAGE
         for key, value in msg.items():
             if isinstance(value, str):
-                total += count_tokens(value, model)
+                texts.append(value)
             elif key == "name":
                 total += -1  # name token offset
+
+    if not texts:
+        return total
+    try:
+        # One batched call releases the GIL and tokenizes all fields in
+        # Rust, instead of crossing the FFI boundary once per field.
+        total += sum(len(t) for t in _get_encoding(model).encode_ordinary_batch(texts))
+    except Exception:
+        total += sum(count_tokens(t, model) for t in texts)
     return total